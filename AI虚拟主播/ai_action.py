@@ -222,7 +222,7 @@ async def _bgm_loop(track_ids: list[int]):
 async def _play_bgm(url: str):
     try:
         proxy_url = os.getenv("MUSIC_PROXY") or os.getenv("HTTPS_PROXY") or os.getenv("HTTP_PROXY")
-        async with httpx.AsyncClient(timeout=20, proxies=proxy_url or None) as client:
+        async with httpx.AsyncClient(timeout=20, proxy=proxy_url or None) as client:
             r = await client.get(url)
             r.raise_for_status()
             audio_bytes = r.content
@@ -12,16 +12,43 @@
 from __future__ import annotations
 
 import asyncio
+import io
+import os
 import time
 from concurrent.futures import ThreadPoolExecutor
-from pathlib import Path
 from typing import Optional
 import re
 
-import openai as deepseek
+import openai
 import edge_tts
 import pygame
 
+# TTS 文本清理用的正则，模块加载时编译一次
+_PAREN = re.compile(r"[\(（][^\)）]{0,30}[\)）]")
+_SYMBOLS = re.compile(r"[\U0001F300-\U0001F64F\U0001F680-\U0001FAFF\u2600-\u27BF]")
+_STAR = re.compile(r"[\*＊]([^\*＊]{1,30})[\*＊]")
+_WS = re.compile(r"\s+")
+# 任一需要清理的字符；大部分回复一个都不含，可以直接跳过上面几遍替换
+_MARKERS = re.compile(r"[\(（\*＊\U0001F300-\U0001F64F\U0001F680-\U0001FAFF\u2600-\u27BF]")
+
+# 流式回复分段：遇到句末标点且前缀够长就先送去合成
+_SENTENCE_END = re.compile(r"[。！？!?\n]")
+_MIN_CHUNK_CHARS = 5
+_MAX_CHUNK_CHARS = 60
+_AUDIO_QUEUE_MAX = 4
+
+# 进程内所有 AIVoice 共用一个线程池，避免每个实例各建一个
+_DEFAULT_EXECUTOR: Optional[ThreadPoolExecutor] = None
+
+
+def _get_default_executor() -> ThreadPoolExecutor:
+    global _DEFAULT_EXECUTOR
+    if _DEFAULT_EXECUTOR is None:
+        _DEFAULT_EXECUTOR = ThreadPoolExecutor(
+            max_workers=min(4, os.cpu_count() or 1), thread_name_prefix="ai_voice"
+        )
+    return _DEFAULT_EXECUTOR
+
 
 class AIVoice:
     """封装 DeepSeek + EdgeTTS + pygame"""
@@ -33,80 +60,149 @@ class AIVoice:
         prompt: str,
         voice: str = "zh-CN-XiaoyiNeural",
         executor: Optional[ThreadPoolExecutor] = None,
-        tmp_dir: Optional[Path] = None,
+        base_url: Optional[str] = None,
     ):
         self.prompt = prompt
-        deepseek.api_key = deepseek_api_key
+        # 原生异步客户端，LLM 请求不再占用线程池
+        self._aclient = openai.AsyncOpenAI(api_key=deepseek_api_key, base_url=base_url)
         self.voice = voice
-        self.executor = executor or ThreadPoolExecutor(max_workers=2)
-        self.tmp_dir = Path(tmp_dir) if tmp_dir else Path.cwd()
-        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        self.executor = executor or _get_default_executor()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
         # pygame mixer 全局只能 init 一次
         if not pygame.mixer.get_init():
-            pygame.mixer.init()
+            pygame.mixer.init(buffer=4096)
+
+    @classmethod
+    def shutdown(cls):
+        """进程退出时关闭共享线程池"""
+        global _DEFAULT_EXECUTOR
+        if _DEFAULT_EXECUTOR is not None:
+            _DEFAULT_EXECUTOR.shutdown(wait=False)
+            _DEFAULT_EXECUTOR = None
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        return self._loop
 
     async def reply(self, username: str, message: str) -> str:
-        """生成 AI 回复并播放语音，返回文本"""
-        text = await self._generate_deepseek_reply(username, message)
-        ok = await self._tts_and_play(text)
+        """流式生成 AI 回复，按句切分边合成边播放，返回完整文本"""
+        text_q: asyncio.Queue = asyncio.Queue()
+        audio_q: asyncio.Queue = asyncio.Queue(maxsize=_AUDIO_QUEUE_MAX)
+        synth = asyncio.create_task(self._synth_worker(text_q, audio_q))
+        player = asyncio.create_task(self._play_worker(audio_q))
+        parts: list[str] = []
+        pending = ""
+        streamed = False
+        try:
+            async for token in self._stream_deepseek_reply(username, message):
+                parts.append(token)
+                pending += token
+                chunk, pending = self._split_chunk(pending)
+                if chunk:
+                    text_q.put_nowait(chunk)
+            if pending.strip():
+                text_q.put_nowait(pending)
+            streamed = True
+        finally:
+            text_q.put_nowait(None)
+            if not streamed:
+                # LLM 流中途失败：回收两个 worker 再抛出；先停合成，播放端仍在消费，合成端收尾时不会阻塞
+                synth.cancel()
+                await asyncio.gather(synth, return_exceptions=True)
+                player.cancel()
+                await asyncio.gather(player, return_exceptions=True)
+        ok = await synth
+        ok = await player and ok
         if not ok:
             raise RuntimeError("TTS 播放失败")
-        return text
-
-    async def _generate_deepseek_reply(self, username: str, message: str) -> str:
-        loop = asyncio.get_event_loop()
-        resp = await loop.run_in_executor(
-            self.executor,
-            lambda: deepseek.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": self.prompt},
-                    {"role": "user", "content": f"{username}: {message}"},
-                ],
-                max_tokens=150,
-                temperature=0.8,
-            ),
+        return "".join(parts).strip()
+
+    async def _stream_deepseek_reply(self, username: str, message: str):
+        stream = await self._aclient.chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=[
+                {"role": "system", "content": self.prompt},
+                {"role": "user", "content": f"{username}: {message}"},
+            ],
+            max_tokens=150,
+            temperature=0.8,
+            stream=True,
         )
-        return resp.choices[0].message.content.strip()
+        async for event in stream:
+            if not event.choices:
+                continue
+            delta = event.choices[0].delta.content
+            if delta:
+                yield delta
 
-    async def _tts_and_play(self, text: str) -> bool:
-        """edge-tts 合成并播放 mp3"""
-        filename = self.tmp_dir / f"ai_reply_{int(time.time()*1000)}.mp3"
+    @staticmethod
+    def _split_chunk(pending: str) -> tuple[str, str]:
+        """在句末标点处切出可以先播放的前缀；过短的前缀继续攒着"""
+        cut = 0
+        for m in _SENTENCE_END.finditer(pending):
+            if m.end() >= _MIN_CHUNK_CHARS:
+                cut = m.end()
+        if not cut and len(pending) >= _MAX_CHUNK_CHARS:
+            cut = len(pending)
+        return pending[:cut], pending[cut:]
+
+    async def _synth_worker(self, text_q: asyncio.Queue, audio_q: asyncio.Queue) -> bool:
+        ok = True
         try:
-            tts_text = self._clean_tts_text(text)
-            if not tts_text:
-                print('[ai_voice] 清理括号后文本为空，跳过 TTS')
-                return True
-            communicate = edge_tts.Communicate(tts_text, self.voice)
-            await communicate.save(str(filename))
-            await asyncio.get_event_loop().run_in_executor(self.executor, self._play_audio, filename)
-            return True
-        except Exception as e:
-            print(f"[ai_voice] TTS 失败: {e}")
-            return False
-        finally:
-            if filename.exists():
+            while (chunk := await text_q.get()) is not None:
                 try:
-                    filename.unlink()
-                except Exception:
-                    pass
+                    audio = await self._synthesize(chunk)
+                except Exception as e:
+                    print(f"[ai_voice] TTS 失败: {e}")
+                    ok = False
+                    continue
+                if audio is not None:
+                    await audio_q.put(audio)
+        finally:
+            await audio_q.put(None)
+        return ok
+
+    async def _play_worker(self, audio_q: asyncio.Queue) -> bool:
+        while (audio := await audio_q.get()) is not None:
+            await self._get_loop().run_in_executor(self.executor, self._play_audio, audio)
+        return True
+
+    async def _synthesize(self, text: str) -> Optional[io.BytesIO]:
+        """edge-tts 合成 mp3 到内存；清理后为空返回 None"""
+        tts_text = self._clean_tts_text(text)
+        if not tts_text:
+            return None
+        communicate = edge_tts.Communicate(tts_text, self.voice)
+        buf = io.BytesIO()
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                buf.write(chunk["data"])
+        if not buf.tell():
+            raise RuntimeError("TTS 未返回音频数据")
+        buf.seek(0)
+        return buf
 
     def _clean_tts_text(self, text: str) -> str:
         """去掉括号指令 + emoji/符号"""
-        cleaned = re.sub(r"[\(（][^\)\）]{0,30}[\)\）]", "", text)
-        cleaned = re.sub(r"[\U0001F300-\U0001F64F\U0001F680-\U0001FAFF]", "", cleaned)
-        cleaned = re.sub(r"[\u2600-\u27BF]", "", cleaned)
-        cleaned = re.sub(r"\s+", " ", cleaned).strip()
+        if not _MARKERS.search(text):
+            return " ".join(text.split())
+        cleaned = _PAREN.sub("", text)
+        cleaned = _SYMBOLS.sub("", cleaned)
         # 去掉 *包裹* 的星号
-        cleaned = re.sub(r"[\*＊]([^\*＊]{1,30})[\*＊]", r"\\1", cleaned)
-        return cleaned
+        cleaned = _STAR.sub(r"\1", cleaned)
+        return _WS.sub(" ", cleaned).strip()
 
     @staticmethod
-    def _play_audio(path: Path):
+    def _play_audio(audio: io.BytesIO):
+        """阻塞到播放结束：先按音频时长整段休眠，再以短间隔确认尾部"""
         try:
-            pygame.mixer.music.load(str(path))
-            pygame.mixer.music.play()
-            while pygame.mixer.music.get_busy():
-                time.sleep(0.1)
+            sound = pygame.mixer.Sound(file=audio)
+            channel = sound.play()
+            if channel is None:
+                return
+            time.sleep(sound.get_length())
+            while channel.get_busy():
+                time.sleep(0.02)
         except Exception as e:
             print(f"[ai_voice] 播放失败: {e}") 
\ No newline at end of file
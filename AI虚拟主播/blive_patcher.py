@@ -2,26 +2,19 @@
 """blive_patcher.py
 在导入 blive 之前调用，自动把完整 Cookie 与指纹 UA 写入所有 aiohttp 请求头，
 以规避 B 站 412 / 风控。
+
+自己能改的代码请直接用 get_shared_session() 拿全局共享的 ClientSession；
+补丁只兜底那些无法修改、会自行创建 ClientSession 的第三方代码，
+并让它们共用同一个 TCPConnector（连接池 / keep-alive）。
 """
 from __future__ import annotations
-import aiohttp, inspect, functools
+import aiohttp, inspect, functools, asyncio
+from typing import Optional
 from pathlib import Path
 from util_fix import load_config, safe_print as print
 
 CFG_PATH = Path(__file__).resolve().parent / 'config.txt'
-config = load_config(CFG_PATH)
-
-pairs = []
-for k, v in config['COOKIES'].items():
-    if k.startswith('#'):
-        continue
-    try:
-        v.encode('latin-1')
-    except UnicodeEncodeError:
-        continue
-    pairs.append(f"{k}={v}")
-
-cookie_str = '; '.join(pairs)
+cookie_str = load_config(CFG_PATH).cookie_str
 
 UA = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36'
 
@@ -30,10 +23,60 @@ if cookie_str:
 else:
     print(' blive_patcher: 未找到 Cookie 字符串，可能仍会 412')
 
+_SHARED: Optional[aiohttp.ClientSession] = None
+_SHARED_CONNECTOR: Optional[aiohttp.TCPConnector] = None
+_SHARED_LOOP: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _get_shared_connector() -> Optional[aiohttp.TCPConnector]:
+    """返回当前事件循环上的共享连接池；不在事件循环内时返回 None"""
+    global _SHARED_CONNECTOR, _SHARED_LOOP
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+    if _SHARED_CONNECTOR is None or _SHARED_CONNECTOR.closed or _SHARED_LOOP is not loop:
+        _SHARED_CONNECTOR = aiohttp.TCPConnector(
+            limit=100, limit_per_host=32, ttl_dns_cache=300, keepalive_timeout=75
+        )
+        _SHARED_LOOP = loop
+    return _SHARED_CONNECTOR
+
+
+async def get_shared_session() -> aiohttp.ClientSession:
+    """全局共享的 ClientSession（懒加载），已带 UA / Referer / Cookie"""
+    global _SHARED
+    if _SHARED is None or _SHARED.closed or _SHARED_LOOP is not asyncio.get_running_loop():
+        headers = {'User-Agent': UA, 'Referer': 'https://live.bilibili.com/'}
+        if cookie_str:
+            headers['Cookie'] = cookie_str
+        _SHARED = aiohttp.ClientSession(
+            headers=headers, connector=_get_shared_connector(), connector_owner=False
+        )
+    return _SHARED
+
+
+async def close_shared_session():
+    """关闭共享 session 与连接池"""
+    global _SHARED, _SHARED_CONNECTOR
+    if _SHARED is not None and not _SHARED.closed:
+        await _SHARED.close()
+    if _SHARED_CONNECTOR is not None and not _SHARED_CONNECTOR.closed:
+        await _SHARED_CONNECTOR.close()
+    _SHARED = _SHARED_CONNECTOR = None
+
+
 _orig_init = aiohttp.ClientSession.__init__
 
 @functools.wraps(_orig_init)
 def _patched_init(self, *args, **kwargs):
+    # 未显式指定 connector 的 session 共用同一个连接池
+    if kwargs.get('connector') is None and not args:
+        connector = _get_shared_connector()
+        loop = kwargs.get('loop')
+        if connector is not None and (loop is None or loop is _SHARED_LOOP):
+            kwargs['connector'] = connector
+            kwargs['connector_owner'] = False
     headers = kwargs.get('headers') or {}
     # 复制原 headers 避免修改外部引用
     headers = dict(headers)
@@ -6,16 +6,44 @@
 """
 
 import requests
+from requests.adapters import HTTPAdapter
 import time
-import configparser
 import json
+import logging
+from util_fix import load_config as load_shared_config
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # 未安装 orjson 时回退到标准库
+    _loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+# 复用同一个 Session，弹幕发送/登录检查共享 keep-alive 连接，避免每次重新握手
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=20))
+SESSION.headers.update({
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'application/json, text/plain, */*',
+    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+    'Origin': 'https://live.bilibili.com',
+})
+
+_cookie_str_cache = {}
+
+def build_cookie_str(cookies):
+    """拼接 Cookie 字符串，同一组 cookies 只拼接一次"""
+    key = tuple(cookies.items())
+    cookie_str = _cookie_str_cache.get(key)
+    if cookie_str is None:
+        cookie_str = "; ".join(f"{k}={v}" for k, v in cookies.items())
+        _cookie_str_cache[key] = cookie_str
+    return cookie_str
 
 def load_config():
     """加载配置文件，正确区分cookies和其他配置"""
-    config = configparser.ConfigParser(interpolation=None)
-    config.read('config.txt', encoding='utf-8')
-    
-    room_id = int(config.get('DEFAULT', 'room_id'))
+    cfg = load_shared_config(__file__)
     
     # 只获取真正的B站cookies
     valid_cookie_keys = {
@@ -24,8 +52,7 @@ def load_config():
     }
     
     cookies = {}
-    cookies_section = config['COOKIES']
-    for key, value in cookies_section.items():
+    for key, value in cfg.cookies.items():
         # 只处理有效的cookie键
         if key.lower() in valid_cookie_keys:
             # 处理百分号替换
@@ -33,40 +60,38 @@ def load_config():
                 value = value.replace('%%', '%')
             cookies[key] = value
     
-    return room_id, cookies
+    return cfg.room_id, cookies
 
-def send_danmaku_fixed(room_id, cookies, message):
-    """发送弹幕 - 修复版本"""
-    try:
+SEND_URL = 'https://api.live.bilibili.com/msg/send'
+
+class DanmakuClient:
+    """弹幕发送客户端：Cookie、CSRF、请求头等不变量只在初始化时计算一次"""
+
+    def __init__(self, room_id, cookies, session=SESSION):
+        self.room_id = room_id
+        self._roomid_str = str(room_id)
         # 构建cookie字符串 - 只包含有效cookies
-        cookie_str = "; ".join([f"{k}={v}" for k, v in cookies.items()])
-        
-        print(f"🔍 房间号: {room_id}")
-        print(f"🔍 消息: {message}")
-        print(f"🔍 有效Cookies: {list(cookies.keys())}")
-        print(f"🔍 Cookie字符串长度: {len(cookie_str)}")
-        
-        # 准备请求
-        url = 'https://api.live.bilibili.com/msg/send'
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        self._cookie_str = build_cookie_str(cookies)
+        # 验证cookie字符串编码，失败时抛出 UnicodeEncodeError
+        self._cookie_str.encode('latin-1')
+        self._csrf = cookies.get('bili_jct', '')
+        # 通用头已在 session 上设置，这里只放本房间相关的头
+        self._base_headers = {
             'Referer': f'https://live.bilibili.com/{room_id}',
-            'Cookie': cookie_str,
+            'Cookie': self._cookie_str,
             'Content-Type': 'application/x-www-form-urlencoded',
-            'Accept': 'application/json, text/plain, */*',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-            'Origin': 'https://live.bilibili.com',
             'X-Requested-With': 'XMLHttpRequest'
         }
-        
-        # 验证cookie字符串编码
-        try:
-            cookie_str.encode('latin-1')
-            print("✅ Cookie字符串编码验证通过")
-        except UnicodeEncodeError as e:
-            print(f"❌ Cookie字符串编码失败: {e}")
-            return False
-        
+        self._session = session
+
+        logger.debug("🔍 房间号: %s", room_id)
+        logger.debug("🔍 有效Cookies: %s", list(cookies.keys()))
+        logger.debug("🔍 Cookie字符串长度: %d", len(self._cookie_str))
+        logger.debug("🔍 CSRF token: %s...", self._csrf[:10])
+
+    def send(self, message):
+        """发送一条弹幕，成功返回 True"""
+        logger.debug("🔍 消息: %s", message)
         data = {
             'bubble': '0',
             'msg': message,
@@ -74,72 +99,85 @@ def send_danmaku_fixed(room_id, cookies, message):
             'mode': '1',
             'fontsize': '25',
             'rnd': str(int(time.time())),
-            'roomid': str(room_id),
-            'csrf': cookies.get('bili_jct', ''),
-            'csrf_token': cookies.get('bili_jct', '')
+            'roomid': self._roomid_str,
+            'csrf': self._csrf,
+            'csrf_token': self._csrf
         }
         
-        print(f"🔍 CSRF token: {cookies.get('bili_jct', '')[:10]}...")
-        
         # 发送请求
-        response = requests.post(url, headers=headers, data=data)
+        response = self._session.post(SEND_URL, headers=self._base_headers, data=data)
         
-        print(f"🔍 响应状态: {response.status_code}")
-        print(f"🔍 响应内容: {response.text}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("🔍 响应状态: %s", response.status_code)
+            logger.debug("🔍 响应内容: %s", response.text)
         
         if response.status_code == 200:
             try:
-                result = response.json()
+                result = _loads(response.content)
                 if result.get('code') == 0:
-                    print(f"✅ 弹幕发送成功: {message}")
+                    logger.info("✅ 弹幕发送成功: %s", message)
                     return True
                 else:
                     error_msg = result.get('message', '未知错误')
-                    print(f"❌ 弹幕发送失败: {error_msg}")
+                    logger.error("❌ 弹幕发送失败: %s", error_msg)
                     return False
             except:
-                print(f"❌ 响应解析失败: {response.text}")
+                logger.error("❌ 响应解析失败: %s", response.text)
                 return False
         else:
-            print(f"❌ HTTP错误: {response.status_code}")
+            logger.error("❌ HTTP错误: %s", response.status_code)
             return False
+
+_clients = {}
+
+def send_danmaku_fixed(room_id, cookies, message):
+    """发送弹幕 - 修复版本（同一房间/cookies 复用同一个 DanmakuClient）"""
+    try:
+        key = (room_id, tuple(cookies.items()))
+        client = _clients.get(key)
+        if client is None:
+            try:
+                client = DanmakuClient(room_id, cookies)
+                logger.info("✅ Cookie字符串编码验证通过")
+            except UnicodeEncodeError as e:
+                logger.error("❌ Cookie字符串编码失败: %s", e)
+                return False
+            _clients[key] = client
+        return client.send(message)
             
-    except Exception as e:
-        print(f"❌ 发送异常: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception("❌ 发送异常")
         return False
 
 def test_login_status(cookies):
     """测试登录状态"""
     try:
-        cookie_str = "; ".join([f"{k}={v}" for k, v in cookies.items()])
+        cookie_str = build_cookie_str(cookies)
         
         url = 'https://api.bilibili.com/x/web-interface/nav'
         headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
             'Cookie': cookie_str
         }
         
-        response = requests.get(url, headers=headers)
-        result = response.json()
+        response = SESSION.get(url, headers=headers)
+        result = _loads(response.content)
         
         if result.get('code') == 0:
             data = result.get('data', {})
             if data.get('isLogin'):
                 username = data.get('uname', '未知用户')
                 uid = data.get('mid', '未知UID')
-                print(f"✅ 登录状态正常 - 用户: {username}, UID: {uid}")
+                logger.info("✅ 登录状态正常 - 用户: %s, UID: %s", username, uid)
                 return True
             else:
-                print("❌ 用户未登录")
+                logger.error("❌ 用户未登录")
                 return False
         else:
-            print(f"❌ 登录检查失败: {result.get('message')}")
+            logger.error("❌ 登录检查失败: %s", result.get('message'))
             return False
             
-    except Exception as e:
-        print(f"❌ 登录检查异常: {e}")
+    except Exception:
+        logger.exception("❌ 登录检查异常")
         return False
 
 def main():
@@ -191,10 +229,9 @@ def main():
         else:
             print("\n❌ 弹幕发送失败！")
         
-    except Exception as e:
-        print(f"❌ 程序错误: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception("❌ 程序错误")
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
     main() 
\ No newline at end of file
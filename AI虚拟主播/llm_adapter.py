@@ -1,14 +1,28 @@
 """llm_adapter.py - 多大模型回退适配器 (与 tts2 同步)"""
 from __future__ import annotations
 
+import asyncio
+import io
 import logging
 import os
 import json
 import httpx
-from typing import List, Dict, Any
+from typing import AsyncIterator, List, Dict, Any
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # 未安装 orjson 时回退到标准库
+    _loads = json.loads
 
 logger = logging.getLogger(__name__)
 
+# 非首选 Provider 胜出后保持优先的调用次数
+_PRIMARY_STRIKES = 20
+
+# 各 Provider 的 httpx 客户端共用的连接池上限
+_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=20, max_connections=100)
+
 
 class ProviderError(Exception):
     """统一的 Provider 异常"""
@@ -20,7 +34,7 @@ class BaseProvider:
     def __init__(self, enabled: bool = True):
         self.enabled = enabled
 
-    def chat(
+    async def chat(
         self,
         messages: List[Dict[str, Any]],
         *,
@@ -30,19 +44,31 @@ class BaseProvider:
     ) -> str:  # noqa: D401
         raise ProviderError("not implemented")
 
+    async def chat_stream(
+        self,
+        messages: List[Dict[str, Any]],
+        *,
+        model: str | None = None,
+        max_tokens: int = 150,
+        temperature: float = 0.8,
+    ) -> AsyncIterator[str]:
+        """逐段产出回复文本；不支持流式的 Provider 一次性产出完整回复"""
+        yield await self.chat(messages, model=model, max_tokens=max_tokens, temperature=temperature)
+
 
 class DeepSeekProvider(BaseProvider):
     name = "deepseek"
 
     def __init__(self, client, default_model: str, enabled: bool = True):
+        """client 需为 openai.AsyncOpenAI 实例"""
         super().__init__(enabled)
         self._client = client
         self._default_model = default_model
 
-    def chat(self, messages: List[Dict[str, Any]], *, model: str | None = None, max_tokens: int = 150, temperature: float = 0.8) -> str:  # noqa: D401
+    async def chat(self, messages: List[Dict[str, Any]], *, model: str | None = None, max_tokens: int = 150, temperature: float = 0.8) -> str:  # noqa: D401
         if not self.enabled:
             raise ProviderError("DeepSeekProvider disabled")
-        resp = self._client.chat.completions.create(
+        resp = await self._client.chat.completions.create(
             model=model or self._default_model,
             messages=messages,
             max_tokens=max_tokens,
@@ -50,6 +76,12 @@ class DeepSeekProvider(BaseProvider):
         )
         return resp.choices[0].message.content.strip()
 
+    async def chat_stream(self, messages: List[Dict[str, Any]], *, model: str | None = None, max_tokens: int = 150, temperature: float = 0.8) -> AsyncIterator[str]:
+        if not self.enabled:
+            raise ProviderError("DeepSeekProvider disabled")
+        async for delta in _openai_stream(self._client, messages, model or self._default_model, max_tokens, temperature):
+            yield delta
+
 
 class OpenAIProvider(BaseProvider):
     name = "openai"
@@ -69,15 +101,15 @@ class OpenAIProvider(BaseProvider):
             raise ProviderError("openai sdk missing") from exc
         if not api_key:
             raise ProviderError("OPENAI_API_KEY missing")
-        http_client = httpx.Client(proxies=proxy, timeout=60.0) if proxy else None
-        self._client = openai.OpenAI(api_key=api_key, base_url=base_url, http_client=http_client) if http_client else openai.OpenAI(api_key=api_key, base_url=base_url)
+        http_client = httpx.AsyncClient(proxy=proxy, timeout=60.0, limits=_HTTP_LIMITS) if proxy else None
+        self._client = openai.AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client) if http_client else openai.AsyncOpenAI(api_key=api_key, base_url=base_url)
         self._default_model = default_model
         self._proxy = proxy
 
-    def chat(self, messages: List[Dict[str, Any]], *, model: str | None = None, max_tokens: int = 150, temperature: float = 0.8) -> str:  # noqa: D401
+    async def chat(self, messages: List[Dict[str, Any]], *, model: str | None = None, max_tokens: int = 150, temperature: float = 0.8) -> str:  # noqa: D401
         if not self.enabled:
             raise ProviderError("OpenAIProvider disabled")
-        resp = self._client.chat.completions.create(
+        resp = await self._client.chat.completions.create(
             model=model or self._default_model,
             messages=messages,
             max_tokens=max_tokens,
@@ -85,13 +117,36 @@ class OpenAIProvider(BaseProvider):
         )
         return resp.choices[0].message.content.strip()
 
+    async def chat_stream(self, messages: List[Dict[str, Any]], *, model: str | None = None, max_tokens: int = 150, temperature: float = 0.8) -> AsyncIterator[str]:
+        if not self.enabled:
+            raise ProviderError("OpenAIProvider disabled")
+        async for delta in _openai_stream(self._client, messages, model or self._default_model, max_tokens, temperature):
+            yield delta
+
+
+async def _openai_stream(client, messages, model: str, max_tokens: int, temperature: float) -> AsyncIterator[str]:
+    """OpenAI 兼容接口的 stream=True 调用，逐个产出增量文本"""
+    stream = await client.chat.completions.create(
+        model=model,
+        messages=messages,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        stream=True,
+    )
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            yield delta
+
 
 class DummyProvider(BaseProvider):
     def __init__(self, name: str):
         super().__init__(enabled=False)
         self.name = name
 
-    def chat(self, *args, **kwargs):  # noqa: D401, ANN002
+    async def chat(self, *args, **kwargs):  # noqa: D401, ANN002
         raise ProviderError(f"Provider {self.name} not implemented")
 
 
@@ -115,24 +170,46 @@ class GeminiProvider(BaseProvider):
         self._genai = genai
         self._default_model = default_model
         self._proxy = proxy
+        # GenerativeModel 和 generation_config 按参数缓存，避免每次请求重建
+        self._models: Dict[str, Any] = {}
+        self._gen_configs: Dict[tuple, Dict[str, Any]] = {}
+
+    def _get_model(self, mdl: str):
+        m = self._models.get(mdl)
+        if m is None:
+            m = self._genai.GenerativeModel(mdl)
+            self._models[mdl] = m
+        return m
+
+    def _get_generation_config(self, max_tokens: int, temperature: float) -> Dict[str, Any]:
+        key = (max_tokens, temperature)
+        cfg = self._gen_configs.get(key)
+        if cfg is None:
+            cfg = {"max_output_tokens": max_tokens, "temperature": temperature}
+            self._gen_configs[key] = cfg
+        return cfg
 
     def _merge_messages(self, messages):
-        parts = [f"{m['role']}: {m['content']}" for m in messages]
-        return "\n".join(parts)
-
-    def chat(self, messages, *, model=None, max_tokens=150, temperature=0.8):  # noqa: D401, ANN002
+        # 逐段写入同一个缓冲区，不为每条消息生成临时字符串
+        buf = io.StringIO()
+        sep = ""
+        for m in messages:
+            buf.write(sep)
+            buf.write(m["role"])
+            buf.write(": ")
+            buf.write(m["content"])
+            sep = "\n"
+        return buf.getvalue()
+
+    async def chat(self, messages, *, model=None, max_tokens=150, temperature=0.8):  # noqa: D401, ANN002
         if not self.enabled:
             raise ProviderError("GeminiProvider disabled")
 
         prompt = self._merge_messages(messages)
         mdl = model or self._default_model
-        model_obj = self._genai.GenerativeModel(mdl)
-        resp = model_obj.generate_content(
+        resp = await self._get_model(mdl).generate_content_async(
             prompt,
-            generation_config={
-                "max_output_tokens": max_tokens,
-                "temperature": temperature,
-            },
+            generation_config=self._get_generation_config(max_tokens, temperature),
         )
         return resp.text.strip()
 
@@ -151,16 +228,17 @@ class ClaudeProvider(BaseProvider):
             raise ProviderError("ANTHROPIC_API_KEY missing")
 
         self._proxy = proxy
-        self._client = anthropic.Anthropic(api_key=api_key, proxies={"http": proxy, "https": proxy}) if proxy else anthropic.Anthropic(api_key=api_key)
+        http_client = httpx.AsyncClient(proxy=proxy, timeout=60.0, limits=_HTTP_LIMITS) if proxy else None
+        self._client = anthropic.AsyncAnthropic(api_key=api_key, http_client=http_client) if http_client else anthropic.AsyncAnthropic(api_key=api_key)
         self._default_model = default_model
 
-    def chat(self, messages: List[Dict[str, Any]], *, model=None, max_tokens=150, temperature=0.8):
+    async def chat(self, messages: List[Dict[str, Any]], *, model=None, max_tokens=150, temperature=0.8):
         if not self.enabled:
             raise ProviderError("ClaudeProvider disabled")
 
         claude_msgs = [{"role": m.get("role", "user"), "content": m.get("content", "")} for m in messages]
 
-        resp = self._client.messages.create(
+        resp = await self._client.messages.create(
             model=model or self._default_model,
             max_tokens=max_tokens,
             temperature=temperature,
@@ -174,12 +252,14 @@ class LocalProvider(BaseProvider):
 
     def __init__(self, endpoint: str, default_model: str = "local-model", proxy: str | None = None, enabled: bool = True, timeout: float = 60.0):
         super().__init__(enabled)
-        self._endpoint = endpoint.rstrip("/") + "/v1/chat/completions"
+        self._endpoint = endpoint.rstrip("/")
         self._default_model = default_model
         self._timeout = timeout
         self._proxy = proxy
+        # 复用同一个客户端的连接池，避免每次请求重新建立 TCP/TLS 连接
+        self._http = httpx.AsyncClient(base_url=self._endpoint, timeout=timeout, proxy=proxy, limits=_HTTP_LIMITS) if proxy else httpx.AsyncClient(base_url=self._endpoint, timeout=timeout, limits=_HTTP_LIMITS)
 
-    def chat(self, messages: List[Dict[str, Any]], *, model=None, max_tokens=150, temperature=0.8):
+    async def chat(self, messages: List[Dict[str, Any]], *, model=None, max_tokens=150, temperature=0.8):
         if not self.enabled:
             raise ProviderError("LocalProvider disabled")
 
@@ -190,18 +270,27 @@ class LocalProvider(BaseProvider):
             "temperature": temperature,
         }
         try:
-            r = httpx.post(self._endpoint, json=payload, timeout=self._timeout, proxies=self._proxy) if self._proxy else httpx.post(self._endpoint, json=payload, timeout=self._timeout)
+            r = await self._http.post("/v1/chat/completions", json=payload)
             r.raise_for_status()
-            return r.json()["choices"][0]["message"]["content"].strip()
+            return _loads(r.content)["choices"][0]["message"]["content"].strip()
         except Exception as exc:  # noqa: BLE001
             raise ProviderError(f"LocalProvider HTTP error: {exc}") from exc
 
 
 class LLMRouter:
     def __init__(self, cfg, *, deepseek_client=None):
+        """deepseek_client 需为 openai.AsyncOpenAI 实例"""
         default_order = ["deepseek", "openai", "claude", "gemini", "local"]
         order_raw = cfg.get("DEFAULT", "llm.order", fallback=",".join(default_order))
         self._order = [n.strip() for n in order_raw.split(",") if n.strip()] if order_raw else default_order
+        # 主 Provider 超过该时长未返回，就并行启动下一个（对冲请求）。
+        # 普通对话请求本身就要数秒，默认值需明显大于正常延迟，否则几乎每次都会重复调用付费接口；
+        # <= 0 表示不对冲，仅在前一个失败后才启动下一个
+        hedge_delay = cfg.getfloat("DEFAULT", "llm.hedge_delay", fallback=8.0)
+        self._hedge_delay = hedge_delay if hedge_delay > 0 else None
+        # 最近一次胜出的 Provider 下标，下次从它开始；非首选时每调用一次扣一次，扣完回到首选重新探测
+        self._primary_idx = 0
+        self._strikes_left = 0
         self._providers: List[BaseProvider] = []
         for name in self._order:
             enabled = cfg.getboolean("DEFAULT", f"{name}.enable", fallback=True)
@@ -247,14 +336,69 @@ class LLMRouter:
         if not self._providers:
             raise RuntimeError("No LLM providers available")
 
-    def chat(self, messages: List[Dict[str, Any]], *, model: str | None = None, max_tokens: int = 150, temperature: float = 0.8) -> str:  # noqa: D401
+    async def chat(self, messages: List[Dict[str, Any]], *, model: str | None = None, max_tokens: int = 150, temperature: float = 0.8) -> str:  # noqa: D401
+        """按顺序对冲调用各 Provider：先启动首个，每隔 hedge_delay（未设置时不按时间）或前一个失败时再启动下一个，取最先成功的结果"""
+        providers = self._ordered_providers()
+        tasks: Dict[asyncio.Task, BaseProvider] = {}
+        last_exc: Exception | None = None
+        idx = 0
+        try:
+            while idx < len(providers) or tasks:
+                if idx < len(providers):
+                    p = providers[idx]
+                    idx += 1
+                    task = asyncio.create_task(p.chat(messages, model=model, max_tokens=max_tokens, temperature=temperature))
+                    tasks[task] = p
+                timeout = self._hedge_delay if idx < len(providers) else None
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    p = tasks.pop(task)
+                    exc = task.exception()
+                    if exc is None:
+                        self._promote(p)
+                        return task.result()
+                    logger.warning("Provider %s failed: %s", p.name, exc)
+                    last_exc = exc
+        finally:
+            for task in tasks:
+                task.cancel()
+        raise ProviderError(str(last_exc) if last_exc else "All providers failed")
+
+    async def chat_stream(self, messages: List[Dict[str, Any]], *, model: str | None = None, max_tokens: int = 150, temperature: float = 0.8) -> AsyncIterator[str]:
+        """流式调用：按顺序尝试各 Provider，逐段产出文本。
+
+        流式输出无法在多个 Provider 间对冲，因此逐个尝试；只有在尚未产出任何文本时失败才会切换到下一个。
+        """
         last_exc: Exception | None = None
-        for p in self._providers:
-            if not p.enabled:
-                continue
+        for p in self._ordered_providers():
+            started = False
             try:
-                return p.chat(messages, model=model, max_tokens=max_tokens, temperature=temperature)
+                async for delta in p.chat_stream(messages, model=model, max_tokens=max_tokens, temperature=temperature):
+                    if not started:
+                        started = True
+                        self._promote(p)
+                    yield delta
+                if started:
+                    return
             except Exception as exc:  # noqa: BLE001
+                if started:
+                    raise
                 logger.warning("Provider %s failed: %s", p.name, exc)
                 last_exc = exc
-        raise ProviderError(str(last_exc) if last_exc else "All providers failed") 
\ No newline at end of file
+        raise ProviderError(str(last_exc) if last_exc else "All providers failed")
+
+    def _ordered_providers(self) -> List[BaseProvider]:
+        """从当前首选 Provider 开始排列已启用的 Provider，并扣减非首选的剩余次数"""
+        if self._primary_idx:
+            self._strikes_left -= 1
+            if self._strikes_left <= 0:
+                self._primary_idx = 0
+        order = self._providers[self._primary_idx:] + self._providers[:self._primary_idx]
+        return [p for p in order if p.enabled]
+
+    def _promote(self, winner: BaseProvider) -> None:
+        idx = self._providers.index(winner)
+        if idx != self._primary_idx:
+            logger.info("LLM primary provider -> %s", winner.name)
+            self._primary_idx = idx
+            self._strikes_left = _PRIMARY_STRIKES
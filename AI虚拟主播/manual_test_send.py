@@ -1,28 +1,18 @@
-import configparser, requests, time, os
+import requests, time
+from util_fix import load_config
 
-config=configparser.ConfigParser(interpolation=None)
-config.optionxform=str
-config.read('config.txt', encoding='utf-8')
-room_id=int(config['DEFAULT']['room_id'])
-cookies=dict(config['COOKIES'])
-
-safe_pairs=[]
-for k,v in cookies.items():
-    try:
-        v.encode('latin-1')
-    except UnicodeEncodeError:
-        continue
-    safe_pairs.append(f"{k}={v}")
+cfg=load_config(__file__)
+room_id=cfg.room_id
 
 headers={
     'User-Agent':'Mozilla/5.0',
     'Referer':f'https://live.bilibili.com/{room_id}',
     'Origin':'https://live.bilibili.com',
     'Content-Type':'application/x-www-form-urlencoded',
-    'Cookie':'; '.join(safe_pairs)
+    'Cookie':cfg.cookie_str
 }
 
-csrf=cookies.get('bili_jct','')
+csrf=cfg.csrf
 
 payload={
     'bubble':'0',
@@ -1,46 +1,58 @@
 """music_login.py (GitHub-safe subset)
-提供网易云音乐扫码登录工具，**每次** 调用都要求重新扫码验证。
+提供网易云音乐扫码登录工具；本地 Cookie 有效时直接复用，否则询问是否扫码。
 """
 from __future__ import annotations
 
 import asyncio
 import base64
+import json
 import logging
 import pathlib
 from typing import Optional
 
 import httpx
 
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # 未安装 orjson 时回退到标准库
+    _loads = json.loads
+
 logger = logging.getLogger(__name__)
 
 _API_BASE = "https://163api.qijieya.cn"
 
 _client: Optional[httpx.AsyncClient] = None
+_LIMITS = httpx.Limits(max_keepalive_connections=10, max_connections=20)
+# 扫码状态轮询间隔（秒）
+_QR_POLL_WAITING = 0.8
+_QR_POLL_SCANNED = 0.5
+_QR_POLL_MAX_BACKOFF = 5.0
 # 本地持久化 Cookie 文件
 _COOKIE_FILE = pathlib.Path.home() / ".netease_cookie.txt"
 
 
+async def _ask(msg: str) -> bool:
+    """在线程池中执行 input()，避免阻塞事件循环中的其他任务（如直播 WS 监听）。"""
+    loop = asyncio.get_running_loop()
+    try:
+        ans = await loop.run_in_executor(None, lambda: input(msg).strip().lower())
+    except EOFError:
+        return False
+    return ans in {"y", "yes", "1"}
+
+
 async def get_netease_client(force_login: bool | None = None) -> httpx.AsyncClient:
     """返回登录或匿名的 AsyncClient。
 
     - ``force_login=True``  强制扫码
-    - ``force_login=False`` 匿名
-    - ``None``             运行时询问用户 y/n（*每次启动都会询问*）
+    - ``force_login=False`` 匿名（本地 Cookie 有效时仍会复用）
+    - ``None``             本地 Cookie 有效则直接复用，否则询问用户 y/n（最多询问一次）
     """
     global _client  # noqa: PLW0603
     if _client is not None:
         return _client
 
-    # ----------------------------
-    # NEW: 统一在首次调用时询问用户是否重新登录
-    # ----------------------------
-    if force_login is None:
-        try:
-            ans = input("是否需要重新扫码登录网易云音乐？(y/N): ").strip().lower()
-            force_login = ans in {"y", "yes", "1"}
-        except EOFError:
-            force_login = False
-
     headers: dict[str, str] = {"User-Agent": "Mozilla/5.0"}
     # 读取历史 Cookie
     if _COOKIE_FILE.exists():
@@ -48,7 +60,7 @@ async def get_netease_client(force_login: bool | None = None) -> httpx.AsyncClie
         if saved_cookie:
             headers["Cookie"] = saved_cookie
 
-    _client = httpx.AsyncClient(base_url=_API_BASE, timeout=10, headers=headers)
+    _client = httpx.AsyncClient(base_url=_API_BASE, timeout=10, headers=headers, limits=_LIMITS)
 
     # 检查 Cookie 是否仍然有效（若未要求强制登录）
     if not force_login and "Cookie" in _client.headers:
@@ -66,11 +78,7 @@ async def get_netease_client(force_login: bool | None = None) -> httpx.AsyncClie
         return _client
 
     if force_login is None:
-        try:
-            ans = input("Cookie 已失效，需要扫码登录才能播放 VIP 歌曲，是否继续？(y/N): ").strip().lower()
-            force_login = ans in {"y", "yes", "1"}
-        except EOFError:
-            force_login = False
+        force_login = await _ask("本地 Cookie 缺失或已失效，需要扫码登录才能播放 VIP 歌曲，是否继续？(y/N): ")
 
     if not force_login:
         logger.info("ℹ️ 用户选择跳过登录，继续匿名模式")
@@ -86,14 +94,32 @@ async def get_netease_client(force_login: bool | None = None) -> httpx.AsyncClie
     return _client
 
 
+async def close_netease_client() -> None:
+    """关闭共享的 AsyncClient"""
+    global _client  # noqa: PLW0603
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def _check_login(client: httpx.AsyncClient) -> bool:
+    """查询登录状态；未登录时接口返回的 account 为空或 null。"""
+    try:
+        r = await client.post("/login/status", params={"timestamp": _ts()})
+        data = _loads(r.content).get("data") or {}
+        return bool(data.get("account"))
+    except Exception:  # noqa: BLE001
+        return False
+
+
 async def _login_qrcode(client: httpx.AsyncClient):
     r = await client.get("/login/qr/key", params={"timestamp": _ts()})
-    key = r.json().get("data", {}).get("unikey")
+    key = _loads(r.content).get("data", {}).get("unikey")
     if not key:
         raise RuntimeError("无法获取扫码 key")
 
     r = await client.get("/login/qr/create", params={"key": key, "qrimg": True, "timestamp": _ts()})
-    data = r.json().get("data", {})
+    data = _loads(r.content).get("data", {})
     qr_base64 = data.get("qrimg", "")
     qr_url = data.get("qrurl") or data.get("url")
     if not qr_base64:
@@ -105,21 +131,32 @@ async def _login_qrcode(client: httpx.AsyncClient):
 
     _render_qr_terminal(qr_url)
 
+    # 自适应轮询：等待扫码时 0.8s，已扫码待确认时加快到 0.5s，请求出错时指数退避至 5s
+    delay = _QR_POLL_WAITING
     while True:
-        await asyncio.sleep(2)
-        r = await client.get("/login/qr/check", params={"key": key, "timestamp": _ts()})
-        code = r.json().get("code")
+        await asyncio.sleep(delay)
+        try:
+            r = await client.get("/login/qr/check", params={"key": key, "timestamp": _ts()})
+            payload = _loads(r.content)
+        except Exception as exc:  # noqa: BLE001
+            delay = min(delay * 2, _QR_POLL_MAX_BACKOFF)
+            logger.debug("扫码状态查询失败，%.1fs 后重试: %s", delay, exc)
+            continue
+        code = payload.get("code")
         if code == 800:
             raise RuntimeError("二维码已失效，请重新运行登录")
         if code == 801:
+            delay = _QR_POLL_WAITING
             continue  # 等待扫码
         if code == 802:
-            logger.info("✅ 已扫描，请在手机确认登录")
+            if delay != _QR_POLL_SCANNED:
+                logger.info("✅ 已扫描，请在手机确认登录")
+            delay = _QR_POLL_SCANNED
             continue
         if code == 803:
             logger.info("🎉 登录成功！")
             # 设置 Cookie 字符串
-            json_cookie = r.json().get("cookie", "")
+            json_cookie = payload.get("cookie", "")
             if not json_cookie:
                 cookie_pairs = [f"{k}={v}" for k, v in r.cookies.items()]
                 json_cookie = "; ".join(cookie_pairs)
@@ -1,9 +1,13 @@
+import functools
 import yaml
 from pathlib import Path
 from typing import List, Union
 
 __all__ = ["load_preset"]
 
+# libyaml 的 C 实现比纯 Python 解析快一个数量级，未编译时回退
+_Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 def _flatten(data: Union[str, List[str]]) -> str:
     if isinstance(data, str):
         return data.strip()
@@ -20,12 +24,22 @@ def load_preset(preset_path: str | Path) -> str:
     """
     path = Path(preset_path)
     if not path.is_absolute():
-        path = (Path(__file__).parent / path).resolve()
-    if not path.exists():
-        raise FileNotFoundError(f"Preset file not found: {path}")
+        path = Path(__file__).parent / path
+    # 一次 stat 同时完成存在性检查与取 mtime
+    try:
+        mtime_ns = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Preset file not found: {path}") from None
+
+    # 以 (路径, mtime) 为键缓存，文件修改后自动重新解析
+    return _load(str(path), mtime_ns)
+
 
-    with path.open("r", encoding="utf-8") as f:
-        data = yaml.safe_load(f)
+@functools.lru_cache(maxsize=32)
+def _load(path_str: str, mtime_ns: int) -> str:
+    # 二进制打开，交给 libyaml 自行识别编码
+    with open(path_str, "rb") as f:
+        data = yaml.load(f, Loader=_Loader)
 
     if isinstance(data, dict):
         parts = []
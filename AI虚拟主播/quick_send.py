@@ -1,10 +1,19 @@
-import sys, configparser
+import asyncio
+import sys
 from sample_2025_ultimate import DanmakuSender
+from util_fix import load_config
 
-config=configparser.ConfigParser(interpolation=None); config.optionxform=str
-config.read('config.txt', encoding='utf-8')
-room_id=int(config['DEFAULT']['room_id'])
-sender=DanmakuSender(room_id, dict(config['COOKIES']))
-msg=sys.argv[1] if len(sys.argv)>1 else '测试'
-print('send:', msg)
-print(sender.send_danmaku(msg)) 
\ No newline at end of file
+
+async def main():
+    cfg=load_config(__file__)
+    sender=DanmakuSender(cfg.room_id, dict(cfg.cookies))
+    msg=sys.argv[1] if len(sys.argv)>1 else '测试'
+    print('send:', msg)
+    try:
+        print(await sender.send_danmaku(msg))
+    finally:
+        await sender.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
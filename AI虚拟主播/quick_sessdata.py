@@ -1,51 +1,146 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-print("🔍 快速获取SESSDATA指导")
-print("=" * 40)
-print()
-print("📋 步骤：")
-print("1. 确保你已经登录B站")
-print("2. 在B站页面按 F12")
-print("3. 点击 'Application'(应用程序) 标签")
-print("4. 左侧展开 'Cookies' → 'https://www.bilibili.com'")
-print("5. 在列表中找到 'SESSDATA' 行")
-print("6. 复制 'Value' 列的值")
-print()
-print("💡 SESSDATA 大概长这样:")
-print("   abc123def456ghi789...")
-print()
-print("📝 复制到剪贴板后，修改 config.txt:")
-print("   将 SESSDATA = ")
-print("   改为 SESSDATA = 你复制的值")
-print()
-print("🧪 然后运行测试:")
-print("   python test_full_auth.py")
-print()
-
-sessdata = input("请粘贴SESSDATA值 (直接Enter跳过): ").strip()
-
-if sessdata:
+import os
+import re
+import sys
+import threading
+from typing import Final
+
+CONFIG_PATH = 'config.txt'
+
+# 只改写 SESSDATA 这一行，保留其余内容的注释、大小写与空白
+_SESSDATA_RE = re.compile(r'^(SESSDATA[ \t]*=)([^\r\n]*)', re.M | re.I)
+_COOKIES_RE = re.compile(r'^\[COOKIES\][ \t]*$', re.M)
+
+# config.txt 原文缓存：{"text": str, "mtime": float, "mode": int}，文件未修改时直接复用
+_cfg_cache: dict = {}
+_cfg_lock = threading.Lock()
+
+
+def _load_config() -> str:
+    with _cfg_lock:
+        st = os.stat(CONFIG_PATH)
+        if _cfg_cache.get('mtime') != st.st_mtime:
+            with open(CONFIG_PATH, encoding='utf-8', newline='') as f:
+                _cfg_cache['text'] = f.read()
+            _cfg_cache['mtime'] = st.st_mtime
+            _cfg_cache['mode'] = st.st_mode & 0o777
+        return _cfg_cache['text']
+
+
+def _prefetch_config() -> None:
+    """后台预读 config.txt，失败时留给 update_sessdata 报错"""
     try:
-        # 读取配置
-        import configparser
-        config = configparser.ConfigParser(interpolation=None)
-        config.read('config.txt', encoding='utf-8')
-        
-        # 更新SESSDATA
-        config.set('COOKIES', 'SESSDATA', sessdata)
-        
-        # 保存
-        with open('config.txt', 'w', encoding='utf-8') as f:
-            config.write(f)
-        
-        print("✅ SESSDATA 已更新到 config.txt!")
-        print("🧪 现在运行测试: python test_full_auth.py")
-        
-    except Exception as e:
-        print(f"❌ 更新失败: {e}")
-        print("请手动编辑 config.txt 文件")
-else:
-    print("⏭️ 已跳过，请手动更新 config.txt")
-
-input("\n按Enter键退出...") 
\ No newline at end of file
+        _load_config()
+    except OSError:
+        pass
+
+
+def update_sessdata(value: str) -> bool:
+    """把 SESSDATA 写入 config.txt 的 [COOKIES] 段；值未变化时不写文件并返回 False"""
+    data = _load_config()
+
+    m = _SESSDATA_RE.search(data)
+    if m and m.group(2).strip() == value:
+        return False
+
+    # 更新SESSDATA：直接按匹配位置拼接，复用上面的查找结果
+    if m:
+        new = f'{data[:m.end(1)]} {value}{data[m.end():]}'
+    else:
+        # 没有 SESSDATA 行：插到 [COOKIES] 段头之后，没有该段则追加
+        newline = '\r\n' if '\r\n' in data else '\n'
+        line = f'SESSDATA = {value}'
+        m = _COOKIES_RE.search(data)
+        if m:
+            new = f'{data[:m.end()]}{newline}{line}{data[m.end():]}'
+        else:
+            sep = '' if not data or data.endswith('\n') else newline
+            new = f'{data}{sep}[COOKIES]{newline}{line}{newline}'
+
+    # 保存：先一次性写入临时文件再原子替换，写到一半崩溃也不会截断 config.txt
+    payload = new.encode('utf-8')
+    tmp_path = CONFIG_PATH + '.tmp'
+    # 权限位沿用读取时缓存的值，不再重新 stat config.txt
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, _cfg_cache['mode'])
+    try:
+        view = memoryview(payload)
+        while view:
+            view = view[os.write(fd, view):]
+        # rename 不改变 mtime，直接对已打开的句柄 fstat
+        mtime = os.fstat(fd).st_mtime
+    finally:
+        os.close(fd)
+    os.replace(tmp_path, CONFIG_PATH)
+    # 写回的内容即缓存内容，刷新 mtime 避免下次重新打开读取
+    with _cfg_lock:
+        _cfg_cache['text'] = new
+        _cfg_cache['mtime'] = mtime
+    return True
+
+
+# 相邻字面量在编译期折叠为单个常量
+_BANNER: Final[str] = (
+    "🔍 快速获取SESSDATA指导\n"
+    "========================================\n"
+    "\n"
+    "📋 步骤：\n"
+    "1. 确保你已经登录B站\n"
+    "2. 在B站页面按 F12\n"
+    "3. 点击 'Application'(应用程序) 标签\n"
+    "4. 左侧展开 'Cookies' → 'https://www.bilibili.com'\n"
+    "5. 在列表中找到 'SESSDATA' 行\n"
+    "6. 复制 'Value' 列的值\n"
+    "\n"
+    "💡 SESSDATA 大概长这样:\n"
+    "   abc123def456ghi789...\n"
+    "\n"
+    "📝 复制到剪贴板后，修改 config.txt:\n"
+    "   将 SESSDATA = \n"
+    "   改为 SESSDATA = 你复制的值\n"
+    "\n"
+    "🧪 然后运行测试:\n"
+    "   python test_full_auth.py\n"
+    "\n"
+)
+
+def prompt_and_update() -> None:
+    """交互式获取 SESSDATA 并写入 config.txt"""
+    if len(sys.argv) > 1:
+        # quick_sessdata.py <SESSDATA>：命令行直接给值，无需交互
+        sessdata = sys.argv[1].strip()
+    else:
+        # 整段说明一次写出
+        sys.stdout.write(_BANNER)
+        sys.stdout.flush()
+
+        # 用户阅读说明、粘贴 SESSDATA 期间在后台读好 config.txt
+        threading.Thread(target=_prefetch_config, daemon=True).start()
+
+        try:
+            sessdata = input("请粘贴SESSDATA值 (直接Enter跳过): ").strip()
+        except EOFError:
+            sessdata = ""
+
+    if sessdata:
+        try:
+            if update_sessdata(sessdata):
+                print("✅ SESSDATA 已更新到 config.txt!")
+            else:
+                print("ℹ️ SESSDATA 与 config.txt 中的值相同，无需更新")
+            print("🧪 现在运行测试: python test_full_auth.py")
+
+        except Exception as e:
+            print(f"❌ 更新失败: {e}")
+            print("请手动编辑 config.txt 文件")
+    else:
+        print("⏭️ 已跳过，请手动更新 config.txt")
+
+    # 非交互运行（脚本/CI）时不等待回车
+    if sys.stdin.isatty():
+        input("\n按Enter键退出...")
+
+
+if __name__ == "__main__":
+    prompt_and_update()
@@ -7,13 +7,22 @@ B站AI虚拟主播弹幕回复系统 - 2025年版本
 """
 
 import asyncio
+import datetime
+import functools
+import itertools
+import operator
+import pathlib
 import random
+import re
+import tempfile
 import time
+import unicodedata
 import configparser
 from concurrent.futures import ThreadPoolExecutor
 import threading
 import queue
-import traceback
+from collections import OrderedDict, deque
+import urllib.parse
 import json
 import sys  # ensure available for patch
 import blive_patcher  # 注入Cookie+UA以绕过412
@@ -55,6 +64,13 @@ import httpx
 # 本地 LLM 适配器
 from llm_adapter import LLMRouter
 from ai_action import dispatch_actions, strip_control_sequences, start_background_music, configure_bgm, parse_playlist_id
+from music_login import get_netease_client, close_netease_client
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # 未安装 orjson 时回退到标准库
+    _loads = json.loads
 
 # B站弹幕相关 - 使用最新的bliver库
 try:
@@ -79,6 +95,13 @@ except ImportError:
     class Event:
         pass
 
+# 可选：uvloop 事件循环（仅 Linux/macOS 可用，Windows 下自动使用标准 asyncio）
+try:
+    import uvloop
+    UVLOOP_AVAILABLE = True
+except ImportError:
+    UVLOOP_AVAILABLE = False
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -98,101 +121,216 @@ print("🚀 启动中...")
 logger.info("🔍 检查依赖库...")
 logger.info(f"blive库: {'✅ 可用' if BLIVE_AVAILABLE else '❌ 不可用'}")
 logger.info(f"bilibili-live库: {'✅ 可用' if BILIBILI_LIVE_AVAILABLE else '❌ 不可用'}")
+logger.info(f"uvloop: {'✅ 可用' if UVLOOP_AVAILABLE else '❌ 不可用（使用标准 asyncio）'}")
 
 from overlay_server import ensure_server, push_subtitle
 
+# 弹幕热路径上反复使用的正则，模块加载时编译一次
+_WS_RE = re.compile(r"\s+")
+# 表情三类合并为一个正则，一次扫描即可按组名区分：颜文字 / Emoji / ★☆✧♥✨ 等特符
+_EMOTE_RE = re.compile(
+    r'(?P<kaomoji>[\(（][^\n]{1,30}?[\)）])'
+    r'|(?P<emoji>[\U0001F300-\U0001F64F\U0001F680-\U0001FAFF])'
+    r'|(?P<symbol>[\u2600-\u27BF])'
+)
+# 表情可能出现的起始字符（左括号 / Emoji / 特符），用于快速排除不含表情的文本
+_EMOTE_HINT_RE = re.compile(r'[\(（\U0001F300-\U0001F64F\U0001F680-\U0001FAFF\u2600-\u27BF]')
+
+# TTS 朗读前清理：括号动作 / Emoji / 特符合并为一次删除，*包裹* 单独处理
+_TTS_STRIP_RE = re.compile(
+    r"[\(（][^\)\）]{0,30}[\)）]"
+    r"|[\U0001F300-\U0001F64F\U0001F680-\U0001FAFF]"
+    r"|[\u2600-\u27BF]"
+)
+_TTS_STAR_RE = re.compile(r"[\*＊]([^\*＊]{1,30})[\*＊]")
+
+# 自己发出的弹幕记录上限（LRU），长时间直播时内存保持有界
+_SELF_LRU_MAX = 4096
+# 脱敏昵称的填充字符：半角/全角星号、装饰星，以及允许的中英文标点、空格与省略号
+_MASK_STARS = "*＊★☆"
+_MASK_FILLERS = "．。.。！!?,，·。、… "
+_MASK_FILL_SET = frozenset(_MASK_STARS + _MASK_FILLERS)
+# _extract_emojis 结果缓存条数上限
+_EMOJI_CACHE_MAX = 512
+# 本场进入过直播间的观众 UID 记录上限，超出时淘汰最早进入的
+_VIEWER_UIDS_MAX = 4096
+# 待发送弹幕队列上限：突发事件时超出部分丢弃最旧的一条
+_DANMU_SEND_Q_MAX = 64
+# 礼物事件队列上限与并发处理协程数：礼物雨时排队处理，不再为每个礼物创建任务
+_GIFT_Q_MAX = 256
+_GIFT_WORKERS = 2
+# 观众昵称缓存有效期（秒）与条数上限（LRU）
+_UNAME_TTL = 600
+_UNAME_CACHE_MAX = 10000
+# 流式回复按句切分送入 TTS：句末标点，以及一句的最少字数（太短的句子并入下一句）
+_SENTENCE_END_RE = re.compile(r'[。！？!?\n]')
+_MIN_SENTENCE_CHARS = 5
+# 已解析昵称的本地缓存（与 config.txt 同目录），重启后免去一次阻塞的 API 查询
+_UNAME_CACHE_FILE = '.uname_cache.json'
+
+
+def _last_emote(s: str) -> str:
+    """单次扫描记录每类最后出现的表情，再按 颜文字 > Emoji > 特符 的优先级取"""
+    last = {}
+    for m in _EMOTE_RE.finditer(s):
+        last[m.lastgroup] = m.group()
+    return last.get('kaomoji') or last.get('emoji') or last.get('symbol') or ''
+
+
+# bilibili-live 礼物对象的字段：(候选属性名, 缺省值)，不同版本字段名不一
+_GIFT_FIELDS = (
+    (('uid',), 0),
+    (('uname', 'username'), 'unknown'),
+    (('gift_name', 'giftName'), '礼物'),
+    (('num',), 1),
+)
+# 礼物对象类型 -> 取字段函数，每种类型只探测一次属性名
+_GIFT_GETTERS: dict = {}
+
+
+def _make_gift_getter(sample):
+    spec = [(next((n for n in names if hasattr(sample, n)), None), default)
+            for names, default in _GIFT_FIELDS]
+    if all(name for name, _ in spec):
+        return operator.attrgetter(*(name for name, _ in spec))
+    return lambda g: tuple(getattr(g, name, default) if name else default for name, default in spec)
+
+
+def _gift_fields(gift) -> tuple:
+    """返回 (uid, 昵称, 礼物名, 数量)"""
+    getter = _GIFT_GETTERS.get(type(gift))
+    if getter is None:
+        getter = _GIFT_GETTERS[type(gift)] = _make_gift_getter(gift)
+    try:
+        return getter(gift)
+    except AttributeError:
+        # 同类型对象字段不一致时，逐个按候选名回退
+        return tuple(
+            next((getattr(gift, n) for n in names if hasattr(gift, n)), default)
+            for names, default in _GIFT_FIELDS
+        )
+
+
+def _read_uname_cache(path: str) -> dict:
+    """读取 {uid: 昵称} 缓存文件，不存在或损坏时返回空字典"""
+    try:
+        with open(path, 'rb') as f:
+            data = _loads(f.read())
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _write_uname_cache(path: str, data: dict) -> None:
+    """先写临时文件再原子替换，避免中途退出留下半个 JSON"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
 class DanmakuSender:
     """现代化B站弹幕发送器"""
     
     def __init__(self, room_id: int, cookies: Dict[str, str]):
         self.room_id = room_id
         self.cookies = cookies
-        self.session = requests.Session()
 
-        # 重新构造仅包含 latin-1 值的 Cookie 头
-        safe_cookie_pairs = []
-        for k, v in cookies.items():
+        # Cookie 字符串只在构造时拼接一次：请求头仅保留 latin-1 值，SDK 后备使用全部
+        self._cookie_header = '; '.join(
+            f"{k}={v}" for k, v in cookies.items() if self._is_latin1(k, v)
+        )
+        self._cookie_str = '; '.join(f"{k}={v}" for k, v in cookies.items())
+
+        # 常驻异步客户端：发送弹幕直接在事件循环上复用连接，不再占用线程池
+        self.aclient = httpx.AsyncClient(
+            headers={
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+                'Referer': f'https://live.bilibili.com/{room_id}',
+                'Origin': 'https://live.bilibili.com',
+                'Accept': 'application/json, text/plain, */*',
+                'Content-Type': 'application/x-www-form-urlencoded',
+                'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+                'Accept-Encoding': 'gzip, deflate',
+                'Cookie': self._cookie_header
+            },
+            timeout=10,
+        )
+
+        # 发送弹幕时附加的固定请求头，只构造一次；客户端级请求头由 httpx 自动合并
+        csrf_token = cookies.get('bili_jct', '')
+        self._send_headers = {
+            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+            'X-CSRF-Token': csrf_token,
+            'X-Requested-With': 'XMLHttpRequest'
+        }
+        # 表单中除 msg/rnd 外的字段固定不变，预先编码好
+        self._static_suffix: bytes = urllib.parse.urlencode({
+            'bubble': '0',
+            'color': '16777215',
+            'mode': '1',
+            'fontsize': '25',
+            'roomid': str(room_id),
+            'csrf': csrf_token,
+            'csrf_token': csrf_token
+        }).encode('utf-8')
+
+        # bilibili_live SDK 后备客户端只创建一次，接口不稳定时不必每次重建会话
+        self._fallback_client = None
+        if BILIBILI_LIVE_AVAILABLE:
             try:
-                v.encode('latin-1')
-            except UnicodeEncodeError:
-                logger.debug(f"Cookie 值非 latin-1, 已忽略: {k}")
-                continue
-            safe_cookie_pairs.append(f"{k}={v}")
-            self.session.cookies.set(k, v)
-
-        cookie_header_str = '; '.join(safe_cookie_pairs)
-
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Referer': f'https://live.bilibili.com/{room_id}',
-            'Origin': 'https://live.bilibili.com',
-            'Accept': 'application/json, text/plain, */*',
-            'Content-Type': 'application/x-www-form-urlencoded',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Cookie': cookie_header_str
-        })
+                self._fallback_client = BilibiliLive(self._cookie_str, room_id=room_id)
+            except Exception as e:
+                logger.warning(f"bilibili_live 后备客户端初始化失败: {e}")
         
-    def send_danmaku(self, message: str) -> bool:
+    @staticmethod
+    def _is_latin1(key: str, value: str) -> bool:
+        try:
+            value.encode('latin-1')
+        except UnicodeEncodeError:
+            logger.debug(f"Cookie 值非 latin-1, 已忽略: {key}")
+            return False
+        return True
+
+    async def aclose(self) -> None:
+        await self.aclient.aclose()
+
+    async def send_danmaku(self, message: str) -> bool:
         """发送弹幕到直播间（UTF-8 编码，避免 latin-1 报错）"""
         try:
-            import re
-            clean_msg = re.sub(r"\s+", " ", message).strip()  # 保留 emoji 只清理多余空白
+            clean_msg = _WS_RE.sub(" ", message).strip()  # 保留 emoji 只清理多余空白
             logger.info(f" 准备发送弹幕(len={len(clean_msg)} chars, bytes={len(clean_msg.encode('utf-8'))}): {clean_msg}")
             # Removed length truncation: always send full message
             if not clean_msg:
                 logger.error(" 弹幕内容为空，已跳过发送")
                 return False
 
-            logger.debug(f" 准备发送弹幕: {clean_msg}")
+            logger.debug(" 准备发送弹幕: %s", clean_msg)
             message = clean_msg
 
-            csrf_token = self.cookies.get('bili_jct', '')
-            
             url = 'https://api.live.bilibili.com/msg/send'
-            payload = {
-                'bubble': '0',
-                'msg': message,
-                'color': '16777215',
-                'mode': '1',
-                'fontsize': '25',
-                'rnd': str(int(time.time())),
-                'roomid': str(self.room_id),
-                'csrf': csrf_token,
-                'csrf_token': csrf_token
-            }
-            
-            import urllib.parse
-            encoded: bytes = urllib.parse.urlencode(payload, encoding='utf-8').encode('utf-8')
-
-            resp = self.session.post(
-                url,
-                data=encoded,
-                headers={
-                    **self.session.headers,
-                    'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
-                    'Content-Length': str(len(encoded)),
-                    'X-CSRF-Token': csrf_token,
-                    'X-Requested-With': 'XMLHttpRequest'
-                }
+            encoded: bytes = (
+                b'msg=' + urllib.parse.quote_plus(message).encode('ascii')
+                + b'&rnd=' + str(int(time.time())).encode('ascii')
+                + b'&' + self._static_suffix
             )
-            result = resp.json()
+
+            # Content-Length 由 httpx 根据 content 自动计算
+            resp = await self.aclient.post(url, content=encoded, headers=self._send_headers)
+            result = _loads(resp.content)
             
             if result.get('code') == 0:
                 logger.info(f" 弹幕发送成功: {message}")
                 return message  # 返回实际发送内容，供上层记录
             else:
                 logger.error(f"弹幕发送失败: code={result.get('code')} msg={result.get('message')}")
-                logger.debug(f"Response raw: {resp.text}")
+                logger.debug("Response raw: %s", resp.text)
                 print('Danmaku API raw response:', resp.text)
 
                 # 尝试使用 bilibili_live SDK 作为后备方案
-                if BILIBILI_LIVE_AVAILABLE:
+                if self._fallback_client is not None:
                     try:
-                        from bilibili_live import BilibiliLive
-                        cookie_str = '; '.join([f"{k}={v}" for k, v in self.cookies.items()])
-                        live_client = BilibiliLive(cookie_str, room_id=self.room_id)
-                        live_client.send_danmaku(message)
+                        # SDK 为同步接口，放到默认线程池执行
+                        await asyncio.to_thread(self._fallback_client.send_danmaku, message)
                         logger.info(" fallback:bilibili_live 弹幕发送成功")
                         return message
                     except Exception as e2:
@@ -205,6 +343,7 @@ class DanmakuSender:
 
 class AIVTuber2025:
     """2025年AI虚拟主播主程序"""
+    busy: bool = False  # 是否正在处理观众互动
     
     def __init__(self):
         self.room_id = None
@@ -222,11 +361,17 @@ class AIVTuber2025:
         pygame.mixer.init()
         
         # 新增：用于串行化音频播放，保证一次只播放一段
-        import asyncio  # 这里确保 asyncio 可用
         self.audio_lock = asyncio.Lock()
+        # 正在播放的 Sound 需保持引用，避免播放途中被回收
+        self._current_sound: "pygame.mixer.Sound | None" = None
         
-        # 线程池
-        self.executor = ThreadPoolExecutor(max_workers=4)
+        # 线程池：同步网络调用（LLM 回退、SDK 弹幕后备等）与音频播放分开排队，互不占用
+        # 阻塞调用以网络 I/O 为主，大小可用环境变量 AIVT_POOL 调整；同时作为事件循环默认线程池
+        self.llm_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv('AIVT_POOL', '8')), thread_name_prefix='llm'
+        )
+        # 播放由 audio_lock 串行化，单线程即可
+        self.audio_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='audio')
         
         # 控制变量
         self.running = False
@@ -235,68 +380,82 @@ class AIVTuber2025:
         
         # 加载配置
         self.load_config()
+
+        # 实例在事件循环内创建，缓存当前循环，避免每次调用 get_event_loop()
+        self._loop = asyncio.get_running_loop()
+        # to_thread / run_in_executor(None, ...) 也落到同一个线程池，不再另起默认池
+        self._loop.set_default_executor(self.llm_executor)
+        # 常用的线程池调用预先绑定好
+        self._play_audio_async = functools.partial(
+            self._loop.run_in_executor, self.audio_executor, self._play_audio
+        )
+        # TTS 输出复用两个固定临时文件轮流写入：播放由 audio_lock 串行化，
+        # 交替使用可避免覆盖 pygame 仍占用的上一段文件，也省去每次的创建/删除
+        _tmp_dir = pathlib.Path(tempfile.gettempdir())
+        self._tts_slots = (str(_tmp_dir / 'ai_reply_a'), str(_tmp_dir / 'ai_reply_b'))
+        self._tts_slot = 0
+        # 后台任务（字幕推送、动作指令）的强引用，防止任务未完成就被 GC
+        self._bg_tasks: set[asyncio.Task] = set()
+        # 回复弹幕统一进入有界队列，由单个后台协程顺序发送
+        self._danmu_send_q: asyncio.Queue[str] = asyncio.Queue(maxsize=_DANMU_SEND_Q_MAX)
+        # 礼物事件 (uid, 昵称, 礼物名, 数量) 同样排队，由 _GIFT_WORKERS 个协程处理
+        self._gift_q: asyncio.Queue[tuple[int, str, str, int]] = asyncio.Queue(maxsize=_GIFT_Q_MAX)
+        # 队列溢出告警的上次时间，按队列名分别限频
+        self._drop_warn_ts: dict[str, float] = {}
+        # 上一条排队发送的弹幕（归一化后），与之相同的表情不再重复发送
+        self._last_danmaku = ''
         
-        # 记录最近自己发送的弹幕/表情，用于过滤
-        from collections import deque
-        self._recent_self_msgs = deque(maxlen=10)
-        # 新增：记录最近自己发送的表情（Emoji / 颜文字），用于更精准地忽略自身弹幕
-        self._recent_self_emojis = deque(maxlen=10)
-        # 会话级去重：保存本次会话中所有由主播账号主动发送的弹幕/表情，防止历史过长时 deque 被挤掉导致自问自答
-        # 总量通常很小（不会超过几百条），使用 set 即可。
-        self._all_self_msgs: set[str] = set()
-        self._all_self_emojis: set[str] = set()
+        # 记录自己发送的弹幕/表情（归一化后），用于过滤回显，防止自问自答
+        # 有界 LRU：最近发送的排在末尾，超过上限时淘汰最早的记录
+        self._self_msg_lru: "OrderedDict[str, None]" = OrderedDict()
         self._current_popularity: int = 0
+        # _extract_emojis 结果缓存：文本 -> 表情（无表情为 ''），有界 LRU
+        self._emoji_cache: "OrderedDict[str, str]" = OrderedDict()
         
         # --- 记忆功能 ---
-        from collections import deque as _dq
-        # 最近 20 轮 (user, msg, ai_reply) 供上下文
-        self._history: _dq[tuple[str, str, str]] = _dq(maxlen=10)
+        # 最近 10 轮 (user, msg, ai_reply) 供上下文
+        self._history: deque[tuple[str, str, str]] = deque(maxlen=10)
+        # 其中非本人发起的最近 5 轮，写入历史时顺带筛好，闲聊吐槽直接取用
+        self._audience_history: deque[tuple[str, str, str]] = deque(maxlen=5)
+        # 与 _history 同步维护的 LLM 消息（每轮 user + assistant 两条），追加时构造，调用时直接复用
+        self._history_msgs: deque[dict[str, str]] = deque(maxlen=20)
+        # 系统提示词在 load_config 中确定后不再变化
+        self._system_msg = {"role": "system", "content": self.ai_prompt}
         
         # 登录用户名相关属性已在 load_config 中初始化，不要在此处覆盖
         
-        # 用户名缓存：uid -> 完整昵称
-        self._uname_cache: dict[int, str] = {}
+        # 用户名缓存：uid -> (完整昵称, 获取时间)，超过 _UNAME_TTL 后重新获取
+        # 有界 LRU，启动时用磁盘缓存预热，退出时写回（仅在有新昵称时）
+        self._uname_cache: "OrderedDict[int, tuple[str, float]]" = OrderedDict()
+        now = time.time()
+        for k, v in self._uname_disk.items():
+            if k.isdigit() and isinstance(v, str) and v:
+                self._uname_cache[int(k)] = (v, now)
+        while len(self._uname_cache) > _UNAME_CACHE_MAX:
+            self._uname_cache.popitem(last=False)
+        del self._uname_disk
+        self._uname_dirty = False
+        # 正在进行中的昵称查询：同一 uid 的并发请求共享一次 HTTP 调用
+        self._uname_futures: dict[int, asyncio.Future] = {}
         
         # ---- 主动聊天相关 ----
-        self._last_activity_ts = time.time()
+        # 空闲计时使用单调时钟，不受系统校时影响
+        self._last_activity_ts = time.monotonic()
 
         # 在线人数缓存
         self._viewer_cnt: int = 0
-        self._viewer_cnt_ts: float = 0.0
-        self._live_viewer_uids: set[int] = set()
-
-        def _get_online_viewers() -> int:
-            import time, requests
-            if time.time() - self._viewer_cnt_ts < 60:
-                return self._viewer_cnt
-            try:
-                headers = {
-                    "User-Agent": "Mozilla/5.0",
-                    "Referer": f"https://live.bilibili.com/{self.room_id}"
-                }
-                urls = [
-                    f"https://api.live.bilibili.com/xlive/web-room/v1/index/getInfoByRoom?room_id={self.room_id}",
-                    f"https://api.live.bilibili.com/room/v1/Room/get_info?room_id={self.room_id}",
-                ]
-                for api_url in urls:
-                    try:
-                        r = requests.get(api_url, headers=headers, timeout=3)
-                        data = r.json()
-                    except Exception:
-                        continue
-                    if data.get('code') == 0:
-                        online = None
-                        if 'room_info' in data.get('data', {}):
-                            online = data['data']['room_info'].get('online')
-                        elif 'online' in data.get('data', {}):
-                            online = data['data'].get('online')
-                        if online is not None:
-                            self._viewer_cnt = int(online)
-                            self._viewer_cnt_ts = time.time()
-                            break
-            except Exception as e:
-                logger.debug(f"[idle] 获取在线人数失败: {e}")
-            return self._viewer_cnt
+        self._viewer_cnt_ts: float = float('-inf')
+        # 按进入顺序记录（dict 保序），超过上限淘汰最早的，长时间直播不再无限增长
+        self._live_viewer_uids: dict[int, None] = {}
+
+        # 房间信息、观众昵称查询共用的异步客户端
+        self._http = httpx.AsyncClient(
+            headers={
+                "User-Agent": "Mozilla/5.0",
+                "Referer": f"https://live.bilibili.com/{self.room_id}"
+            },
+            timeout=3,
+        )
 
         def _estimate_viewers(raw: int) -> int:
             real_small = len(self._live_viewer_uids)
@@ -314,29 +473,152 @@ class AIVTuber2025:
             return interval
 
         self._calc_idle_interval = _calc_idle_interval
-        self._get_online_viewers = _get_online_viewers
         self._next_idle_interval = self._calc_idle_interval()
         logger.debug(f"[idle] 初始化定时器: 下一次闲聊将在 ~{self._next_idle_interval}s 后触发")
 
         def _reset_idle_timer():
-            self._last_activity_ts = time.time()
+            self._last_activity_ts = time.monotonic()
             self._next_idle_interval = self._calc_idle_interval()
-            logger.debug(f"[idle] 计时器已重置: 下一次闲聊将在 ~{self._next_idle_interval}s 后触发")
+            logger.debug("[idle] 计时器已重置: 下一次闲聊将在 ~%ss 后触发", self._next_idle_interval)
         self._reset_idle_timer = _reset_idle_timer
         
-        # 统一清理函数
+    async def _get_online_viewers(self) -> int:
+        """获取直播间在线人数（缓存 60 秒）；两个接口并发请求，取先成功的一个"""
+        if time.monotonic() - self._viewer_cnt_ts < 60:
+            return self._viewer_cnt
+
+        async def _fetch(api_url: str):
+            r = await self._http.get(api_url)
+            data = _loads(r.content)
+            if data.get('code') != 0:
+                return None
+            info = data.get('data') or {}
+            if 'room_info' in info:
+                return info['room_info'].get('online')
+            return info.get('online')
+
+        urls = [
+            f"https://api.live.bilibili.com/xlive/web-room/v1/index/getInfoByRoom?room_id={self.room_id}",
+            f"https://api.live.bilibili.com/room/v1/Room/get_info?room_id={self.room_id}",
+        ]
+        pending = {self._loop.create_task(_fetch(u)) for u in urls}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        logger.debug(f"[idle] 获取在线人数失败: {task.exception()}")
+                        continue
+                    online = task.result()
+                    if online is not None:
+                        self._viewer_cnt = int(online)
+                        self._viewer_cnt_ts = time.monotonic()
+                        return self._viewer_cnt
+        finally:
+            # 已拿到结果时取消较慢的请求
+            for task in pending:
+                task.cancel()
+        return self._viewer_cnt
+
+    def _spawn(self, coro) -> asyncio.Task:
+        """以后台任务方式运行协程，不阻塞调用方"""
+        task = self._loop.create_task(coro)
+        self._bg_tasks.add(task)
+        task.add_done_callback(self._bg_tasks.discard)
+        return task
+
+    def _put_drop_oldest(self, q: asyncio.Queue, item, what: str) -> None:
+        """放入有界队列；队列满时丢弃最旧的一项，告警每 5 秒最多一次"""
+        try:
+            q.put_nowait(item)
+        except asyncio.QueueFull:
+            q.get_nowait()
+            q.task_done()
+            q.put_nowait(item)
+            now = time.monotonic()
+            if now - self._drop_warn_ts.get(what, 0.0) >= 5:
+                self._drop_warn_ts[what] = now
+                logger.warning(f"⚠️ 待处理{what}过多，已丢弃最旧的一条")
+
+    def _queue_danmaku(self, msg: str) -> None:
+        """记录并排队发送一条回复弹幕；与上一条相同则跳过，队列满时丢弃最旧的一条"""
+        norm = self._norm_msg(msg)
+        if norm == self._last_danmaku:
+            logger.debug("[dedupe] 跳过与上一条相同的弹幕: %s", msg)
+            return
+        self._last_danmaku = norm
+        # 先记录，避免推流回显先于 HTTP 响应到来导致漏判
+        self._mark_self(msg)
+        self._put_drop_oldest(self._danmu_send_q, msg, "弹幕")
+
+    async def _danmaku_send_worker(self) -> None:
+        """逐条取出队列中的弹幕发送"""
+        q = self._danmu_send_q
+        while True:
+            msg = await q.get()
+            try:
+                sent = await self.danmaku_sender.send_danmaku(msg)
+                # 如发送内容有变化（理论上不会），再追加一次
+                if sent and sent != msg:
+                    self._mark_self(sent)
+            except Exception as e:
+                logger.error(f" 弹幕发送任务失败: {e}")
+            finally:
+                q.task_done()
+
+    def _queue_gift(self, uid: int, username: str, gift_name: str, gift_num: int) -> None:
+        self._put_drop_oldest(self._gift_q, (uid, username, gift_name, gift_num), "礼物")
+
+    async def _gift_worker(self) -> None:
+        """逐个处理排队的礼物事件"""
+        q = self._gift_q
+        while True:
+            uid, username, gift_name, gift_num = await q.get()
+            try:
+                await self._reply_gift(uid, username, gift_name, gift_num)
+            except Exception as e:
+                logger.error(f" 礼物处理失败: {e}")
+            finally:
+                q.task_done()
+
+    async def _reply_gift(self, uid: int, username: str, gift_name: str, gift_num: int) -> None:
+        username_full = await self._resolve_username(uid, username)
+        pseudo_msg = f"送出了 {gift_name} x{gift_num}"
+
+        await self.reply_and_speak(username_full, pseudo_msg)
+
+
+    def _note_viewer(self, uid: int) -> None:
+        d = self._live_viewer_uids
+        d[uid] = None
+        if len(d) > _VIEWER_UIDS_MAX:
+            del d[next(iter(d))]
+
+    def _mark_self(self, msg: str) -> None:
+        """记录一条自己发送的弹幕（归一化后写入 LRU）"""
+        norm = self._norm_msg(msg)
+        d = self._self_msg_lru
+        d[norm] = None
+        d.move_to_end(norm)
+        if len(d) > _SELF_LRU_MAX:
+            d.popitem(last=False)
+
+    def _recent_self(self, n: int = 10) -> list[str]:
+        """最近 n 条自己发送的记录（新的在前），仅取尾部，不复制整个 LRU"""
+        return list(itertools.islice(reversed(self._self_msg_lru), n))
+
+    # 统一清理函数
     @staticmethod
     def _norm_msg(msg: str) -> str:
-        import re
-        return re.sub(r"\s+", " ", msg).strip()
+        return _WS_RE.sub(" ", msg).strip()
         
     def load_config(self):
         """加载配置文件"""
         try:
-            config = configparser.ConfigParser(interpolation=None)
+            # RawConfigParser 不做插值，Cookie 中的 % 字符不会触发插值错误
+            config = configparser.RawConfigParser()
             # 保留键名大小写，避免 Cookie 名被强制小写导致服务器不识别
             config.optionxform = str
-            # 保持 interpolation=None，不要再覆盖，否则 % 字符会触发插值错误
             config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.txt')
             logger.info(f" 正在读取配置文件: {config_path}")
             
@@ -379,14 +661,17 @@ class AIVTuber2025:
             api_base_url = config.get('DEFAULT', 'api.base_url', fallback='https://api.deepseek.com/v1').strip()
             deepseek_proxy = config.get('DEFAULT', 'deepseek.proxy', fallback=config.get('NETWORK', 'proxy', fallback='')).strip() or None
             if deepseek_proxy:
-                http_client = httpx.Client(proxies=deepseek_proxy, timeout=60.0)
+                http_client = httpx.Client(proxy=deepseek_proxy, timeout=60.0)
                 self.deepseek_client = deepseek.OpenAI(api_key=deepseek_api_key, base_url=api_base_url, http_client=http_client)
+                async_http_client = httpx.AsyncClient(proxy=deepseek_proxy, timeout=60.0)
+                deepseek_aclient = deepseek.AsyncOpenAI(api_key=deepseek_api_key, base_url=api_base_url, http_client=async_http_client)
             else:
                 self.deepseek_client = deepseek.OpenAI(api_key=deepseek_api_key, base_url=api_base_url)
+                deepseek_aclient = deepseek.AsyncOpenAI(api_key=deepseek_api_key, base_url=api_base_url)
             
-            # 初始化多模型 LLM 适配器（带回退逻辑）
+            # 初始化多模型 LLM 适配器（带回退逻辑，异步对冲调用）
             try:
-                self.llm_router = LLMRouter(config, deepseek_client=self.deepseek_client)
+                self.llm_router = LLMRouter(config, deepseek_client=deepseek_aclient)
             except Exception as e:
                 logger.error(f"❌ 初始化LLMRouter失败: {e}")
                 self.llm_router = None
@@ -442,17 +727,31 @@ class AIVTuber2025:
             # 读取登录昵称（可选）
             self.self_username = config.get('DEFAULT', 'self.username', fallback='').strip()
 
-            # 若未配置用户名但已知UID，尝试通过公开API获取一次
+            # 昵称本地缓存：主播与观众共用，观众部分在 __init__ 中用于预热 _uname_cache
+            self._uname_cache_path = os.path.join(os.path.dirname(config_path), _UNAME_CACHE_FILE)
+            uname_cache = self._uname_disk = _read_uname_cache(self._uname_cache_path)
+
+            # 若未配置用户名但已知UID：先查本地缓存，没有再通过公开API获取一次并写回缓存
             if not self.self_username and self.self_uid:
-                try:
-                    api_url = f'https://api.bilibili.com/x/space/acc/info?mid={self.self_uid}&jsonp=jsonp'
-                    resp = requests.get(api_url, timeout=5)
-                    data = resp.json()
-                    if data.get('code') == 0:
-                        self.self_username = data['data'].get('name', '') or ''
-                        logger.info(f" 已从 API 获取主播昵称: {self.self_username}")
-                except Exception as e:
-                    logger.debug(f"获取主播昵称失败: {e}")
+                self.self_username = uname_cache.get(str(self.self_uid), '')
+                if self.self_username:
+                    logger.info(f" 已从本地缓存读取主播昵称: {self.self_username}")
+                else:
+                    try:
+                        api_url = f'https://api.bilibili.com/x/space/acc/info?mid={self.self_uid}&jsonp=jsonp'
+                        resp = requests.get(api_url, timeout=3)
+                        data = _loads(resp.content)
+                        if data.get('code') == 0:
+                            self.self_username = data['data'].get('name', '') or ''
+                            logger.info(f" 已从 API 获取主播昵称: {self.self_username}")
+                    except Exception as e:
+                        logger.debug(f"获取主播昵称失败: {e}")
+                    if self.self_username:
+                        uname_cache[str(self.self_uid)] = self.self_username
+                        try:
+                            _write_uname_cache(self._uname_cache_path, uname_cache)
+                        except OSError as e:
+                            logger.debug(f"写入昵称缓存失败: {e}")
 
             def _mask_name(name: str) -> str:
                 if not name:
@@ -464,6 +763,11 @@ class AIVTuber2025:
                 return name[0] + ("*" * (len(name) - 2)) + name[-1]
 
             self.self_username_mask = _mask_name(self.self_username)
+            # 自身昵称判断用到的归一化昵称与星号匹配正则，在此一次性算好
+            self._norm_self_full = unicodedata.normalize('NFKC', self.self_username).strip() if self.self_username else ''
+            self._self_star_re = re.compile(
+                rf"^{re.escape(self.self_username_mask[0])}[{re.escape(_MASK_STARS)}]+[{re.escape(_MASK_FILLERS)}]*$"
+            ) if self.self_username_mask else None
 
             if self.self_username:
                 logger.info(f" 已配置登录昵称: {self.self_username} (masked -> {self.self_username_mask})")
@@ -496,49 +800,68 @@ class AIVTuber2025:
             logger.error(f" 配置加载失败: {e}")
             raise
     
-    async def generate_ai_response(self, username: str, message: str) -> str:
-        """使用DeepSeek生成AI回复"""
-        try:
-            import datetime, time as _t
-            messages = [{"role": "system", "content": self.ai_prompt}]
+    async def generate_ai_response(self, username: str, message: str, on_sentence=None) -> str:
+        """使用DeepSeek生成AI回复
 
-            idle_sec = int(_t.time() - self._last_activity_ts)
+        传入 on_sentence 时以流式方式调用 LLM，每凑齐一句就回调一次（原始文本，未去除控制指令）。
+        """
+        # 流式调用时已产出的文本，以及其中尚未交给 on_sentence 的尾部
+        parts = []
+        pending = ''
+        user_msg = None
+        try:
+            self.busy = True
+            idle_sec = int(time.monotonic() - self._last_activity_ts)
             ctx_info = (
                 f"[当前场景] 现在是 {datetime.datetime.now().strftime('%H:%M')}，"
                 f"直播间人气值 ≈ {self._current_popularity}，"
                 f"已 {idle_sec//60} 分 {idle_sec%60} 秒无人互动。"
             )
-            messages.append({"role": "system", "content": ctx_info})
-
-            # 2. 历史对话
-            for uname, umsg, areply in self._history:
-                messages.append({"role": "user", "content": f"{uname}: {umsg}"})
-                messages.append({"role": "assistant", "content": areply})
-
-            # 3. 当前弹幕
-            messages.append({"role": "user", "content": f"{username}: {message}"})
+            user_msg = {"role": "user", "content": f"{username}: {message}"}
+
+            # 系统提示词 + 场景信息 + 历史对话 + 当前弹幕
+            messages = [
+                self._system_msg,
+                {"role": "system", "content": ctx_info},
+                *self._history_msgs,
+                user_msg,
+            ]
             
-            def _chat():
-                # 优先通过适配器调用，支持多模型回退
-                if getattr(self, 'llm_router', None):
-                    return self.llm_router.chat(
-                        messages=messages,
-                        model=self.model_name,
-                        max_tokens=150,
-                        temperature=0.8
-                    )
-                # 回退到旧的 DeepSeek 调用
-                return self.deepseek_client.chat.completions.create(
+            # 优先通过适配器调用，支持多模型回退
+            if getattr(self, 'llm_router', None) and on_sentence is not None:
+                async for delta in self.llm_router.chat_stream(
+                    messages=messages,
                     model=self.model_name,
+                    max_tokens=150,
+                    temperature=0.8
+                ):
+                    parts.append(delta)
+                    pending = self._flush_sentences(pending + delta, on_sentence)
+                if pending.strip():
+                    on_sentence(pending)
+                pending = ''
+                response = ''.join(parts)
+            elif getattr(self, 'llm_router', None):
+                response = await self.llm_router.chat(
                     messages=messages,
+                    model=self.model_name,
                     max_tokens=150,
                     temperature=0.8
                 )
+            else:
+                # 回退到旧的 DeepSeek 调用
+                def _chat():
+                    return self.deepseek_client.chat.completions.create(
+                        model=self.model_name,
+                        messages=messages,
+                        max_tokens=150,
+                        temperature=0.8
+                    )
 
-            response = await asyncio.get_event_loop().run_in_executor(
-                self.executor,
-                _chat
-            )
+                response = await self._loop.run_in_executor(
+                    self.llm_executor,
+                    _chat
+                )
             
             # 兼容适配器直接返回字符串或 OpenAI 客户端响应对象
             if isinstance(response, str):
@@ -546,52 +869,103 @@ class AIVTuber2025:
             else:
                 ai_reply = response.choices[0].message.content.strip()
 
-            await dispatch_actions(ai_reply)
-            ai_reply = strip_control_sequences(ai_reply)
+            return self._finish_reply(username, message, user_msg, ai_reply)
+            
+        except Exception as e:
+            logger.error(f" AI回复生成失败: {e}")
+            # 流式中途失败时，已交给 on_sentence 的句子已经播出：按实际说出的内容记录并返回
+            streamed = ''.join(parts)
+            spoken = streamed[:len(streamed) - len(pending)].strip()
+            if spoken and user_msg is not None:
+                return self._finish_reply(username, message, user_msg, spoken)
+            return f"@{username} 抱歉，我现在有点累了～"
+        finally:
+            self.busy = False
 
-            logger.info(f" AI回复生成: {ai_reply}")
+    def _finish_reply(self, username: str, message: str, user_msg: dict, ai_reply: str) -> str:
+        """派发动作指令、写入历史并推送字幕，返回去掉控制指令后的回复"""
+        # 动作指令与字幕推送放到后台，调用方可立即进入 TTS
+        self._spawn(dispatch_actions(ai_reply))
+        ai_reply = strip_control_sequences(ai_reply)
 
-            # 更新历史
-            self._history.append((username, message, ai_reply))
+        logger.info(f" AI回复生成: {ai_reply}")
 
-            # 活动计时刷新
-            self._reset_idle_timer()
+        # 更新历史
+        self._history.append((username, message, ai_reply))
+        if not self._is_self_sender(0, username):
+            self._audience_history.append((username, message, ai_reply))
+        self._history_msgs.append(user_msg)
+        self._history_msgs.append({"role": "assistant", "content": ai_reply})
 
-            await push_subtitle(ai_reply)
-            # 触发可能的功能指令（如点歌），并去除控制序列
+        # 活动计时刷新
+        self._reset_idle_timer()
 
-            return ai_reply
-            
-        except Exception as e:
-            logger.error(f" AI回复生成失败: {e}")
-            return f"@{username} 抱歉，我现在有点累了～"
+        self._spawn(push_subtitle(ai_reply))
+
+        return ai_reply
+
+    @staticmethod
+    def _flush_sentences(pending: str, on_sentence) -> str:
+        """把 pending 中已完整的句子交给 on_sentence，返回剩余未成句的部分"""
+        last = None
+        for last in _SENTENCE_END_RE.finditer(pending):
+            pass
+        if last is None:
+            return pending
+        head = pending[:last.end()]
+        # 太短的句子先攒着；* 未闭合说明控制指令还没输出完，也先不切
+        if len(head.strip()) < _MIN_SENTENCE_CHARS or head.count('*') % 2:
+            return pending
+        on_sentence(head)
+        return pending[last.end():]
+
+    async def reply_and_speak(self, username: str, message: str) -> str:
+        """生成回复并朗读：LLM 流式输出，每凑齐一句就开始合成播放，不必等整段回复生成完；
+        回复中的表情同时作为弹幕发出"""
+        sentences: asyncio.Queue = asyncio.Queue()
+        speaker = self._loop.create_task(self._speak_sentences(sentences))
+        streamed = False
+
+        def _on_sentence(sentence: str) -> None:
+            nonlocal streamed
+            streamed = True
+            sentences.put_nowait(sentence)
+
+        try:
+            ai_response = await self.generate_ai_response(username, message, on_sentence=_on_sentence)
+            # 非流式路径（无 LLMRouter 或生成失败）时整段朗读
+            if not streamed:
+                sentences.put_nowait(ai_response)
+        finally:
+            sentences.put_nowait(None)
+        # 回复弹幕（仅 Emoji）在回复生成后立即排队发送，与语音播放并行
+        emojis = self._extract_emojis(ai_response)
+        if emojis and self.auto_send:
+            self._queue_danmaku(emojis)
+        await speaker
+        return ai_response
+
+    async def _speak_sentences(self, sentences: asyncio.Queue) -> None:
+        """依次朗读队列中的句子，直到取到 None；整段回复期间持有 audio_lock，避免与其他回复交错"""
+        async with self.audio_lock:
+            while True:
+                sentence = await sentences.get()
+                if sentence is None:
+                    break
+                text = strip_control_sequences(sentence)
+                if not text:
+                    continue
+                try:
+                    await self._speak(text)
+                except Exception as e:
+                    # 单句失败不影响后续句子
+                    logger.error(f" 语音合成/播放失败: {e}")
     
     async def text_to_speech(self, text: str) -> bool:
         """使用Edge TTS将文本转换为语音并播放 (一次只播放一段)"""
         try:
             async with self.audio_lock:
-                voice = "zh-CN-XiaoyiNeural"  # 中文女声
-
-                # 为避免并发写入/占用，使用唯一临时文件
-                import uuid, tempfile, pathlib
-                audio_file = pathlib.Path(tempfile.gettempdir()) / f"ai_reply_{uuid.uuid4().hex}.mp3"
-
-                tts_text = self._clean_tts_text(text)
-                if not tts_text:
-                    logger.warning("⚠️ 清理括号后文本为空，跳过 TTS")
-                    return True
-                # 字幕已在生成回复阶段推送，此处不重复
-                # 适配器合成
-                audio_file = await self.tts_provider.synthesize(tts_text)
-
-                # 播放语音（在线程池中执行，使锁在整个播放期间保持）
-                await asyncio.get_event_loop().run_in_executor(
-                    self.executor,
-                    self._play_audio,
-                    str(audio_file)
-                )
-
-                await self.tts_provider.cleanup(audio_file)
+                await self._speak(text)
             
             logger.info(f" 语音播放完成: {text[:30]}...")
             return True
@@ -599,22 +973,38 @@ class AIVTuber2025:
         except Exception as e:
             logger.error(f" 语音合成/播放失败: {e}")
             return False
+
+    async def _speak(self, text: str) -> None:
+        """合成并播放一段文本；调用方需持有 audio_lock"""
+        tts_text = self._clean_tts_text(text)
+        if not tts_text:
+            logger.warning("⚠️ 清理括号后文本为空，跳过 TTS")
+            return
+        # 字幕已在生成回复阶段推送，此处不重复
+        # 适配器合成，写入轮换的固定临时文件（下次轮到时直接覆盖，无需清理）
+        slot = self._tts_slots[self._tts_slot]
+        self._tts_slot ^= 1
+        audio_file = await self.tts_provider.synthesize(tts_text, out_stem=slot)
+
+        # 在线程池中解码并开始播放，随后按音频时长等待结束，使锁在整个播放期间保持
+        duration = await self._play_audio_async(str(audio_file))
+        if duration:
+            await asyncio.sleep(duration)
     
-    def _play_audio(self, audio_file: str):
-        """在线程池中播放音频"""
+    def _play_audio(self, audio_file: str) -> float:
+        """在线程池中加载并开始播放音频，返回时长（秒），失败返回 0"""
         try:
             # 若仍有残余播放，强制停止，确保一次只播一段
-            if pygame.mixer.music.get_busy():
-                pygame.mixer.music.stop()
-            pygame.mixer.music.load(audio_file)
-            pygame.mixer.music.play()
-            
-            # 等待播放完成
-            while pygame.mixer.music.get_busy():
-                time.sleep(0.1)
-                
+            if self._current_sound is not None:
+                self._current_sound.stop()
+            # Sound 一次性读入整个文件，不再占用文件句柄
+            snd = pygame.mixer.Sound(audio_file)
+            snd.play()
+            self._current_sound = snd
+            return snd.get_length()
         except Exception as e:
             logger.error(f" 音频播放失败: {e}")
+            return 0.0
     
     async def send_test_danmaku(self):
         """发送测试弹幕"""
@@ -627,11 +1017,7 @@ class AIVTuber2025:
         
         message = random.choice(test_messages)
         
-        success = await asyncio.get_event_loop().run_in_executor(
-            self.executor,
-            self.danmaku_sender.send_danmaku,
-            message
-        )
+        success = await self.danmaku_sender.send_danmaku(message)
         
         if success:
             logger.info(f"✅ 测试弹幕发送成功: {message}")
@@ -656,51 +1042,24 @@ class AIVTuber2025:
             
             norm_msg = self._norm_msg(message)
             # 内容匹配 & 去重
-            if (
-                norm_msg in self._recent_self_msgs
-                or norm_msg in self._all_self_msgs
-            ):
+            if norm_msg in self._self_msg_lru:
                 return
             
             # 获取完整观众昵称（若可能）
             username_full = await self._resolve_username(sender_uid, username)
             
-            # 生成AI回复
-            ai_response = await self.generate_ai_response(username_full, message)
+            # 生成AI回复并语音播放
+            await self.reply_and_speak(username_full, message)
             
-            # 语音播放
-            await self.text_to_speech(ai_response)
-            
-            # 发送回复弹幕（仅发送 Emoji）
-            emojis = self._extract_emojis(ai_response)
-            if emojis and self.auto_send:
-                # 先记录，避免推流事件先于 HTTP 回调到来导致漏判
-                norm_e = self._norm_msg(emojis)
-                self._recent_self_msgs.append(norm_e)
-                self._recent_self_emojis.append(emojis)
-                self._all_self_msgs.add(norm_e)
-                self._all_self_emojis.add(emojis)
-
-                sent = await asyncio.get_event_loop().run_in_executor(
-                    self.executor,
-                    self.danmaku_sender.send_danmaku,
-                    emojis
-                )
-                # 如发送内容有变化（理论上不会），再追加一次
-                if sent and sent != emojis:
-                    self._recent_self_msgs.append(self._norm_msg(sent))
-                    self._recent_self_emojis.append(sent)
-                    self._all_self_msgs.add(self._norm_msg(sent))
-                    self._all_self_emojis.add(sent)
-            
-            logger.debug(f"[self-check] Comparing incoming message='{norm_msg}' with cache={list(self._recent_self_msgs)}")
+            # 调试信息需要额外计算，仅在 DEBUG 级别开启时构造
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("[self-check] Comparing incoming message='%s' with cache=%s", norm_msg, self._recent_self())
             
             # 活动计时刷新
             self._reset_idle_timer()
             
-        except Exception as e:
-            logger.error(f" blive弹幕处理失败: {e}")
-            traceback.print_exc()
+        except Exception:
+            logger.exception(" blive弹幕处理失败")
 
     # ------------------ 🎁 礼物事件（blive） ------------------
     async def handle_blive_gift(self, ctx):
@@ -718,30 +1077,10 @@ class AIVTuber2025:
 
             logger.info(f"🎁 [blive] 收到礼物 - uid={sender_uid} name={username}: {gift_name} x{gift_num}")
 
-            pseudo_msg = f"送出了 {gift_name} x{gift_num}"
-            username_full = await self._resolve_username(sender_uid, username)
-
-            ai_response = await self.generate_ai_response(username_full, pseudo_msg)
+            self._queue_gift(sender_uid, username, gift_name, gift_num)
 
-            await self.text_to_speech(ai_response)
-
-            emojis = self._extract_emojis(ai_response)
-            if emojis and self.auto_send:
-                norm_e = self._norm_msg(emojis)
-                self._recent_self_msgs.append(norm_e)
-                self._recent_self_emojis.append(emojis)
-                self.ai_vtuber._all_self_msgs.add(norm_e)
-                self.ai_vtuber._all_self_emojis.add(emojis)
-
-                await asyncio.get_event_loop().run_in_executor(
-                    self.executor,
-                    self.danmaku_sender.send_danmaku,
-                    emojis
-                )
-
-        except Exception as e:
-            logger.error(f" blive礼物处理失败: {e}")
-            traceback.print_exc()
+        except Exception:
+            logger.exception(" blive礼物处理失败")
 
     # Bilibili-live库的事件处理器
     class BilibiliLiveHandler(BilibiliLiveEventHandler):
@@ -762,18 +1101,15 @@ class AIVTuber2025:
                 
                 # 内容匹配（防护双保险）
                 norm_msg = self.ai_vtuber._norm_msg(message)
-                if (
-                    norm_msg in self.ai_vtuber._all_self_msgs
-                ):
+                if norm_msg in self.ai_vtuber._self_msg_lru:
                     logger.debug(" 忽略可能回显的自己弹幕")
                     return
                 
                 # 将处理任务放入异步队列
                 asyncio.create_task(self._handle_danmu_async(getattr(danmu, 'uid', 0), username, message))
                 
-            except Exception as e:
-                logger.error(f" 处理弹幕事件失败: {e}")
-                traceback.print_exc()
+            except Exception:
+                logger.exception(" 处理弹幕事件失败")
         
         async def _handle_danmu_async(self, uid: int, username: str, message: str):
             """异步处理弹幕"""
@@ -781,34 +1117,12 @@ class AIVTuber2025:
                 # 解析完整昵称（若可）
                 username_full = await self.ai_vtuber._resolve_username(uid, username)
 
-                ai_response = await self.ai_vtuber.generate_ai_response(username_full, message)
+                await self.ai_vtuber.reply_and_speak(username_full, message)
                 
-                # 语音播放
-                await self.ai_vtuber.text_to_speech(ai_response)
                 
-                # 发送回复弹幕（仅发送 Emoji）
-                emojis = self.ai_vtuber._extract_emojis(ai_response)
-                if emojis and self.ai_vtuber.auto_send:
-                    # 先记录，避免 race
-                    norm_e = self.ai_vtuber._norm_msg(emojis)
-                    self.ai_vtuber._recent_self_msgs.append(norm_e)
-                    self.ai_vtuber._recent_self_emojis.append(emojis)
-                    self.ai_vtuber._all_self_msgs.add(norm_e)
-                    self.ai_vtuber._all_self_emojis.add(emojis)
-
-                    sent = await asyncio.get_event_loop().run_in_executor(
-                        self.ai_vtuber.executor,
-                        self.ai_vtuber.danmaku_sender.send_danmaku,
-                        emojis
-                    )
-                    if sent and sent != emojis:
-                        self.ai_vtuber._recent_self_msgs.append(self.ai_vtuber._norm_msg(sent))
-                        self.ai_vtuber._recent_self_emojis.append(sent)
-                        self.ai_vtuber._all_self_msgs.add(self.ai_vtuber._norm_msg(sent))
-                        self.ai_vtuber._all_self_emojis.add(sent)
-                
-                logger.debug(f"[self-check BL] incoming='{self.ai_vtuber._norm_msg(message)}' cache={list(self.ai_vtuber._recent_self_msgs)}")
-                logger.debug(f"[self-check BL] incoming emoji='{self.ai_vtuber._extract_emojis(message)}' cache emoji={list(self.ai_vtuber._recent_self_emojis)}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("[self-check BL] incoming='%s' cache=%s", self.ai_vtuber._norm_msg(message), self.ai_vtuber._recent_self())
+                    logger.debug("[self-check BL] incoming emoji='%s'", self.ai_vtuber._extract_emojis(message))
             
             except Exception as e:
                 logger.error(f" 异步弹幕处理失败: {e}")
@@ -818,48 +1132,17 @@ class AIVTuber2025:
             try:
                 gift = event.data
 
-                sender_uid = getattr(gift, 'uid', 0)
-                username = getattr(gift, 'uname', getattr(gift, 'username', 'unknown'))
+                sender_uid, username, gift_name, gift_num = _gift_fields(gift)
 
                 if self.ai_vtuber._is_self_sender(sender_uid, username):
                     return
 
-                gift_name = getattr(gift, 'gift_name', getattr(gift, 'giftName', '礼物'))
-                gift_num = getattr(gift, 'num', 1)
-
                 logger.info(f"🎁 [bilibili-live] 收到礼物 - uid={sender_uid} name={username}: {gift_name} x{gift_num}")
 
-                asyncio.create_task(self._handle_gift_async(sender_uid, username, gift_name, gift_num))
+                self.ai_vtuber._queue_gift(sender_uid, username, gift_name, gift_num)
 
-            except Exception as e:
-                logger.error(f" 处理礼物事件失败: {e}")
-                traceback.print_exc()
-
-        async def _handle_gift_async(self, uid: int, username: str, gift_name: str, gift_num: int):
-            try:
-                username_full = await self.ai_vtuber._resolve_username(uid, username)
-                pseudo_msg = f"送出了 {gift_name} x{gift_num}"
-
-                ai_response = await self.ai_vtuber.generate_ai_response(username_full, pseudo_msg)
-
-                await self.ai_vtuber.text_to_speech(ai_response)
-
-                emojis = self.ai_vtuber._extract_emojis(ai_response)
-                if emojis and self.ai_vtuber.auto_send:
-                    norm_e = self.ai_vtuber._norm_msg(emojis)
-                    self.ai_vtuber._recent_self_msgs.append(norm_e)
-                    self.ai_vtuber._recent_self_emojis.append(emojis)
-                    self.ai_vtuber._all_self_msgs.add(norm_e)
-                    self.ai_vtuber._all_self_emojis.add(emojis)
-
-                    await asyncio.get_event_loop().run_in_executor(
-                        self.ai_vtuber.executor,
-                        self.ai_vtuber.danmaku_sender.send_danmaku,
-                        emojis
-                    )
-
-            except Exception as e:
-                logger.error(f" 异步礼物处理失败: {e}")
+            except Exception:
+                logger.exception(" 处理礼物事件失败")
 
     async def start_blive_listener(self):
         """启动blive弹幕监听器"""
@@ -886,18 +1169,10 @@ class AIVTuber2025:
                         uname = data.get('uname', 'unknown')
                         uid = int(data.get('uid', 0))
                         if uid:
-                            self._live_viewer_uids.add(uid)
+                            self._note_viewer(uid)
                         logger.info(f"👋 [blive] 新观众进入: {uname}")
                         pseudo_msg = "进入了直播间"
-                        ai_resp = await self.generate_ai_response(uname, pseudo_msg)
-                        await self.text_to_speech(ai_resp)
-                        emojis = self._extract_emojis(ai_resp)
-                        if emojis and self.auto_send:
-                            await asyncio.get_event_loop().run_in_executor(
-                                self.executor,
-                                self.danmaku_sender.send_danmaku,
-                                emojis
-                            )
+                        await self.reply_and_speak(uname, pseudo_msg)
                 except Exception as e:
                     logger.error(f" 处理进入房间事件失败: {e}")
                 finally:
@@ -910,17 +1185,10 @@ class AIVTuber2025:
                     uname = data.get('uname', '') or data.get('username', '路人')
                     uid = int(data.get('uid', 0))
                     if uid:
-                        self._live_viewer_uids.add(uid)
+                        self._note_viewer(uid)
                     logger.info(f"👋 [welcome] {uname} 进入直播间")
                     pseudo_msg = "进入了直播间"
-                    ai_resp = await self.generate_ai_response(uname, pseudo_msg)
-                    await self.text_to_speech(ai_resp)
-                    emojis = self._extract_emojis(ai_resp)
-                    if emojis and self.auto_send:
-                        await asyncio.get_event_loop().run_in_executor(
-                            self.executor,
-                            self.danmaku_sender.send_danmaku,
-                            emojis)
+                    await self.reply_and_speak(uname, pseudo_msg)
                 except Exception as e:
                     logger.error(f" 处理 WELCOME 事件失败: {e}")
                 finally:
@@ -968,9 +1236,8 @@ class AIVTuber2025:
             
             return True
             
-        except Exception as e:
-            logger.error(f" bilibili-live监听器启动失败: {e}")
-            traceback.print_exc()
+        except Exception:
+            logger.exception(" bilibili-live监听器启动失败")
             return False
     
     async def run(self):
@@ -981,7 +1248,10 @@ class AIVTuber2025:
             await ensure_server()
             
             # 先启动闲聊守护协程，避免被阻塞
-            asyncio.create_task(self._idle_chat_loop())
+            self._spawn(self._idle_chat_loop())
+            self._spawn(self._danmaku_send_worker())
+            for _ in range(_GIFT_WORKERS):
+                self._spawn(self._gift_worker())
             
             # 不再主动发送测试弹幕，只监听
             
@@ -999,42 +1269,45 @@ class AIVTuber2025:
                 
         except KeyboardInterrupt:
             logger.info(" 用户中断，程序退出")
-        except Exception as e:
-            logger.error(f" 主程序运行失败: {e}")
-            traceback.print_exc()
+        except Exception:
+            logger.exception(" 主程序运行失败")
         finally:
+            if self.danmaku_sender is not None:
+                await self.danmaku_sender.aclose()
+            await self._http.aclose()
+            await blive_patcher.close_shared_session()
+            await close_netease_client()
+            self._save_uname_cache()
             self.cleanup()
     
     def cleanup(self):
         """清理资源"""
         logger.info(" 清理系统资源...")
         pygame.mixer.quit()
-        self.executor.shutdown(wait=True)
+        self.llm_executor.shutdown(wait=True)
+        self.audio_executor.shutdown(wait=True)
 
     async def _idle_chat_loop(self):
         """若直播间长时间无互动，主动找话题聊天"""
-        import time
         first_run = True
         while True:
             await asyncio.sleep(10)
             try:
                 if self.busy:
                     continue
-                if first_run or (time.time() - self._last_activity_ts >= self._next_idle_interval):
+                if first_run or (time.monotonic() - self._last_activity_ts >= self._next_idle_interval):
                     if first_run:
                         logger.debug("[idle] 首次启动，立即进行自我介绍")
                         first_run = False
                     else:
-                        logger.debug(f"[idle] 触发闲聊: 距离上次互动已 {(time.time() - self._last_activity_ts):.0f}s ≥ {self._next_idle_interval}s")
-                    # 仅保留「观众弹幕 + 本人回复」的配对记录
-                    _audience_pairs = [item for item in self._history if not self._is_self_sender(0, item[0])]
-                    if _audience_pairs:
-                        # 取最近 5 轮互动
-                        recent_pairs = _audience_pairs[-5:]
+                        logger.debug(f"[idle] 触发闲聊: 距离上次互动已 {(time.monotonic() - self._last_activity_ts):.0f}s ≥ {self._next_idle_interval}s")
+                    # 仅保留「观众弹幕 + 本人回复」的配对记录（最近 5 轮）
+                    recent_pairs = self._audience_history
+                    if recent_pairs:
                         summary = " | ".join(f"{u}:{m} -> 我:{a}" for u, m, a in recent_pairs)
                         prompt_msg = f"最近和观众的互动: {summary}。你有什么想吐槽或回应的吗？"
                         logger.debug(f"[idle] 基于历史聊天内容进行吐槽: {summary}")
-                        ai_resp = await self.generate_ai_response("观众们", prompt_msg)
+                        await self.reply_and_speak("观众们", prompt_msg)
                     else:
                         candidates = [
                             "好像没有人在呢…要不我先唱首歌？",
@@ -1042,79 +1315,73 @@ class AIVTuber2025:
                             "嗨~ 有没有路过的小伙伴？陪我聊聊天吧！",
                             "欸——都去哪里了？可怜的主播只能对空气说话啦。"
                         ]
-                        import random as _r
-                        pseudo_msg = _r.choice(candidates)
-                        ai_resp = await self.generate_ai_response(self.self_username or "主播", pseudo_msg)
-                    await self.text_to_speech(ai_resp)
-                    emojis = self._extract_emojis(ai_resp)
-                    if emojis and self.auto_send:
-                        await asyncio.get_event_loop().run_in_executor(
-                            self.executor,
-                            self.danmaku_sender.send_danmaku,
-                            emojis
-                        )
+                        pseudo_msg = random.choice(candidates)
+                        await self.reply_and_speak(self.self_username or "主播", pseudo_msg)
                     self._reset_idle_timer()
             except Exception as e:
                 logger.debug(f"idle chat loop error: {e}")
 
     def _extract_emojis(self, text: str) -> str:
         """提取一个表情（优先级：最后一句中的最后一个  颜文字 > Emoji > 特符）。
-        从回复结尾开始逐行向上查找，找到即返回。"""
-        import re
-        # 拆分行，去掉空白
-        segments = [seg.strip() for seg in text.strip().splitlines() if seg.strip()]
-
-        # 正则定义
-        kaomoji_pat = re.compile(r'[\(（][^\n]{1,30}?[\)）]')  # 颜文字
-        emoji_pat = re.compile(r'[\U0001F300-\U0001F64F]|[\U0001F680-\U0001FAFF]')
-        symbol_pat = re.compile(r'[\u2600-\u27BF]')  # ★☆✧♥✨ 等
-
-        def last_token(pattern: re.Pattern, s: str):
-            token = ''
-            for m in pattern.finditer(s):
-                token = m.group(0)
-            return token
-
-        # 从结尾行开始向上查找
-        for seg in reversed(segments):
-            for pattern in (kaomoji_pat, emoji_pat, symbol_pat):
-                tok = last_token(pattern, seg)
-                if tok:
-                    logger.info(f" 选定表情: {tok} (segment='{seg}')")
-                    return tok
-        # 整体兜底搜索（极端情况如整段无换行）
-        for pattern in (kaomoji_pat, emoji_pat, symbol_pat):
-            tok = last_token(pattern, text)
+        同一段文本的结果有界缓存，重复的回复（如闲聊问候）不再重新扫描。"""
+        cache = self._emoji_cache
+        tok = cache.get(text)
+        if tok is not None:
+            cache.move_to_end(text)
+            return tok
+        tok = self._scan_emoji(text)
+        cache[text] = tok
+        if len(cache) > _EMOJI_CACHE_MAX:
+            cache.popitem(last=False)
+        return tok
+
+    @staticmethod
+    def _scan_emoji(text: str) -> str:
+        """从回复结尾开始逐行向上查找表情，找到即返回"""
+        # 多数回复不含任何候选字符：一次字符类扫描即可判定，不再逐行匹配
+        if not _EMOTE_HINT_RE.search(text):
+            logger.warning(" 未找到可用表情，将不发送弹幕")
+            return ''
+        # 从结尾行开始向上查找；行在用到时才 strip，找到即停止
+        for seg in reversed(text.splitlines()):
+            seg = seg.strip()
+            if not seg:
+                continue
+            tok = _last_emote(seg)
             if tok:
-                logger.info(f" 选定表情(全局兜底): {tok}")
+                logger.info(f" 选定表情: {tok} (segment='{seg}')")
                 return tok
+        # 整体兜底搜索（极端情况如整段无换行）
+        tok = _last_emote(text)
+        if tok:
+            logger.info(f" 选定表情(全局兜底): {tok}")
+            return tok
         logger.warning(" 未找到可用表情，将不发送弹幕")
         return ''
 
     def _is_self_sender(self, sender_uid: int, username: str) -> bool:
         """判断一条弹幕是否来自本账号
 
-        1) UID 精准匹配
+        1) 双方 UID 均已知时只比较 UID
         2) 若 UID 为 0 或获取失败，则用脱敏昵称匹配：
            - 与配置中的 `self_username_mask` 完全相等，或
            - 首字符相同且长度一致（应对不同星号数量的脱敏实现）
            - 兼容全角星号、★☆、… 等特殊填充字符
         """
-        import unicodedata, re
+        # UID 最可靠：双方 UID 都已知时直接得出结论，不再做昵称归一化与比对
+        if self.self_uid and sender_uid:
+            return sender_uid == self.self_uid
+
         norm_username = unicodedata.normalize('NFKC', username).strip()
-        norm_self_full = unicodedata.normalize('NFKC', self.self_username).strip() if self.self_username else ''
+        norm_self_full = self._norm_self_full
         mask = self.self_username_mask
 
         # DEBUG: 打印检测过程，便于后续排查
-        logger.debug(
-            f"[self_det] uid={sender_uid} raw_name={repr(username)} norm_name={repr(norm_username)} "
-            f"mask={mask} full={norm_self_full}"
-        )
-
-        # UID 最可靠
-        if self.self_uid and sender_uid == self.self_uid:
-            logger.debug("[self_det]  命中 UID")
-            return True
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "[self_det] uid=%s raw_name=%r norm_name=%r mask=%s full=%s",
+                sender_uid, username, norm_username, mask, norm_self_full,
+            )
 
         # 完整昵称匹配（使用NFKC归一化）
         if norm_self_full and norm_username == norm_self_full:
@@ -1130,17 +1397,14 @@ class AIVTuber2025:
             return True
 
         # 星号宽松匹配 - 支持半角 * 、全角 ＊ 及部分装饰星
-        star_chars = "*＊★☆"
-        additional_fillers = "．。.。！!?,，·。、… "  # 允许的中文/英文标点、空格及省略号
-        star_pattern = rf"^{re.escape(mask[0])}[{re.escape(star_chars)}]+[{re.escape(additional_fillers)}]*$"
-        if re.match(star_pattern, norm_username):
+        if self._self_star_re.match(norm_username):
             logger.debug("[self_det]  星号宽松匹配命中")
             return True
 
         # 一般宽松匹配：首字符一致且其余全部由星号/标点组成
         if (
             norm_username and norm_username[0] == mask[0] and
-            set(norm_username[1:]).issubset(set(star_chars + additional_fillers))
+            _MASK_FILL_SET.issuperset(norm_username[1:])
         ):
             logger.debug("[self_det]  首字符+填充字符匹配命中")
             return True
@@ -1152,34 +1416,68 @@ class AIVTuber2025:
         """若 uid >0，则尝试通过公开API获取完整昵称（带缓存）；失败返回 masked_name"""
         if uid <= 0:
             return masked_name
-        if uid in self._uname_cache:
-            return self._uname_cache[uid]
+        cached = self._uname_cache.get(uid)
+        if cached:
+            self._uname_cache.move_to_end(uid)
+            if time.time() - cached[1] < _UNAME_TTL:
+                return cached[0]
+
+        # 已有同 uid 的查询在进行中：直接等待其结果
+        fut = self._uname_futures.get(uid)
+        if fut is not None:
+            return (await asyncio.shield(fut)) or masked_name
+
+        fut = self._loop.create_future()
+        self._uname_futures[uid] = fut
+        name = None
         try:
-            import requests, asyncio
-            loop = asyncio.get_event_loop()
-            def _fetch():
-                url = f'https://api.bilibili.com/x/space/acc/info?mid={uid}&jsonp=jsonp'
-                resp = requests.get(url, timeout=5)
-                return resp.json()
-            data = await loop.run_in_executor(self.executor, _fetch)
+            # 复用共享的异步客户端，查询期间不占用线程池
+            url = f'https://api.bilibili.com/x/space/acc/info?mid={uid}&jsonp=jsonp'
+            resp = await self._http.get(url, timeout=5)
+            data = _loads(resp.content)
             if data.get('code') == 0:
-                name = data['data'].get('name', '') or masked_name
-                self._uname_cache[uid] = name
-                return name
+                name = data['data'].get('name', '') or None
+                if name:
+                    self._remember_uname(uid, name)
         except Exception:
             pass
-        return masked_name
+        finally:
+            self._uname_futures.pop(uid, None)
+            fut.set_result(name)
+        if name:
+            return name
+        # 查询失败时沿用过期的缓存昵称
+        return cached[0] if cached else masked_name
+
+    def _remember_uname(self, uid: int, name: str) -> None:
+        cache = self._uname_cache
+        if uid not in cache or cache[uid][0] != name:
+            self._uname_dirty = True
+        cache[uid] = (name, time.time())
+        cache.move_to_end(uid)
+        if len(cache) > _UNAME_CACHE_MAX:
+            cache.popitem(last=False)
+
+    def _save_uname_cache(self) -> None:
+        """有新昵称时把 LRU 写回磁盘缓存（连同主播昵称）"""
+        if not self._uname_dirty:
+            return
+        data = {str(uid): name for uid, (name, _) in self._uname_cache.items()}
+        if self.self_uid and self.self_username:
+            data[str(self.self_uid)] = self.self_username
+        try:
+            _write_uname_cache(self._uname_cache_path, data)
+            self._uname_dirty = False
+        except OSError as e:
+            logger.debug(f"写入昵称缓存失败: {e}")
 
     def _clean_tts_text(self, text: str) -> str:
         """清理不应朗读内容：括号动作 + emoji/符号"""
-        import re, unicodedata
-        cleaned = re.sub(r"[\(（][^\)\）]{0,30}[\)）]", "", text)
-        cleaned = re.sub(r"[\U0001F300-\U0001F64F\U0001F680-\U0001FAFF]", "", cleaned)
-        cleaned = re.sub(r"[\u2600-\u27BF]", "", cleaned)
+        cleaned = _TTS_STRIP_RE.sub("", text)
         cleaned = unicodedata.normalize('NFKC', cleaned)
-        cleaned = re.sub(r"\s+", " ", cleaned).strip()
+        cleaned = _WS_RE.sub(" ", cleaned).strip()
         # 去掉 *／＊ 包裹的星号但保留内容
-        cleaned = re.sub(r"[\*＊]([^\*＊]{1,30})[\*＊]", r"\\1", cleaned)
+        cleaned = _TTS_STAR_RE.sub(r"\1", cleaned)
         return cleaned
 
 async def main():
@@ -1210,14 +1508,16 @@ async def main():
         ai_vtuber = AIVTuber2025()
         await ai_vtuber.run()
         
-    except Exception as e:
-        logger.error(f" 程序启动失败: {e}")
-        traceback.print_exc()
+    except Exception:
+        logger.exception(" 程序启动失败")
 
 if __name__ == "__main__":
     print(" B站AI虚拟主播弹幕回复系统 - 2025年版本")
     print("=" * 60)
     print(" 启动中...")
     
+    if UVLOOP_AVAILABLE:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
     # 运行异步主程序
     asyncio.run(main()) 
\ No newline at end of file
@@ -2,12 +2,16 @@
 """util_fix.py
 通用工具：
 1. safe_print -> 过滤非 ASCII 字符，避免 Windows 控制台编码错误
-2. load_config -> 始终以脚本所在目录查找 config.txt
+2. load_config -> 始终以脚本所在目录查找 config.txt，解析结果按路径缓存
 """
 from __future__ import annotations
+from dataclasses import dataclass
 from pathlib import Path
+from types import MappingProxyType
+from typing import Mapping
 import builtins
 import configparser
+import functools
 import sys
 
 
@@ -21,12 +25,66 @@ def safe_print(*args, **kwargs):
     builtins.print(*filtered, **kwargs)
 
 
-def load_config(script_path: str | Path) -> configparser.ConfigParser:
+@dataclass(frozen=True)
+class Config:
+    """config.txt 中弹幕相关的只读配置"""
+    _room_id: str  # [DEFAULT] room_id 原文，读取 room_id 时才校验
+    cookies: Mapping[str, str]
+    cookie_str: str
+    csrf: str
+    latin1_safe: bool
+
+    @property
+    def room_id(self) -> int:
+        """直播间号；未填写或非法时直接报错，避免误发到 0 号房间"""
+        try:
+            room_id = int(self._room_id)
+        except ValueError:
+            room_id = 0
+        if room_id <= 0:
+            raise ValueError(f"config.txt 的 [DEFAULT] room_id 无效: {self._room_id!r}")
+        return room_id
+
+
+def load_config(script_path: str | Path) -> Config:
     script_dir = Path(script_path).resolve().parent
-    cfg_path = script_dir / 'config.txt'
-    cfg = configparser.ConfigParser(interpolation=None)
+    return _load_config(str(script_dir / 'config.txt'))
+
+
+@functools.lru_cache(maxsize=4)
+def _load_config(cfg_path: str) -> Config:
+    # 不需要 % 插值，RawConfigParser 比 ConfigParser 少一层插值处理
+    cfg = configparser.RawConfigParser()
+    cfg.optionxform = str
     cfg.read(cfg_path, encoding='utf-8')
-    return cfg
+
+    cookies = {}
+    if cfg.has_section('COOKIES'):
+        defaults = cfg.defaults()
+        for k, v in cfg.items('COOKIES'):
+            # [DEFAULT] 的键会被继承到每个 section，不是 Cookie
+            if k.startswith('#') or (k in defaults and defaults[k] == v):
+                continue
+            cookies[k] = v
+
+    # 只拼接能以 latin-1 编码的值，否则 HTTP 头会编码失败
+    pairs = []
+    latin1_safe = True
+    for k, v in cookies.items():
+        try:
+            v.encode('latin-1')
+        except UnicodeEncodeError:
+            latin1_safe = False
+            continue
+        pairs.append(f"{k}={v}")
+
+    return Config(
+        _room_id=cfg.get('DEFAULT', 'room_id', fallback='').strip(),
+        cookies=MappingProxyType(cookies),
+        cookie_str='; '.join(pairs),
+        csrf=cookies.get('bili_jct', ''),
+        latin1_safe=latin1_safe,
+    )
 
 # monkey-patch stdout encoding if needed
 try:
@@ -10,17 +10,24 @@ import re
 from typing import Optional
 import os
 import random
-import tempfile
-import pathlib
-import uuid
 import time
 import subprocess
 import signal  # for cross-platform kill
+from collections import OrderedDict, deque
+from dataclasses import dataclass
 
 import httpx
-import pygame
 from music_login import get_netease_client
 
+logger = logging.getLogger(__name__)
+
+# HTTP/2 需要额外安装 h2，缺失时退回 HTTP/1.1 keep-alive
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
 # --- VTS expression controller integration ---
 # ---- 动态定位项目根目录 -----------------------------------------------
 from pathlib import Path
@@ -37,14 +44,18 @@ if str(project_root) not in sys.path:
     sys.path.append(str(project_root))
 from vts_expression_controller import VTSController  # noqa: E402
 
-# Global VTS controller instance (lazy connect)
+# Global VTS controller instance，由主程序启动时调用 init_vts() 建立连接
 _vts_ctrl: VTSController | None = None
+_vts_lock = asyncio.Lock()
 
-async def _ensure_vts_connected():
+async def init_vts():
+    """建立 VTS 连接（只建立一次）。加锁避免多个协程同时首次连接；连接成功后才赋值 _vts_ctrl。"""
     global _vts_ctrl
-    if _vts_ctrl is None:
-        _vts_ctrl = VTSController()
-        await _vts_ctrl.connect()
+    async with _vts_lock:
+        if _vts_ctrl is None:
+            ctrl = VTSController()
+            await ctrl.connect()
+            _vts_ctrl = ctrl
 
 # ---------------------------------------------------------------------------
 # 🎵 网易云音乐播放
@@ -55,25 +66,107 @@ _API_BASE = "https://163api.qijieya.cn"
 # 默认纯音乐歌单 ID（ACG 纯音乐）
 _DEFAULT_BGM_PLAYLIST_ID = 2387965986
 
+# ---- 音频相关环境变量：启动时读取一次，变更后调用 reload_config() ----
+@dataclass
+class _AudioCfg:
+    bgm_vol: int             # BGM 的 ffplay 音量 0~100
+    music_vol: float         # 点歌音量 0~1
+    proxy: Optional[str]     # 网易云请求使用的代理
+    bgm_cache_dir: Path      # BGM 本地缓存目录，按歌曲 ID 存放
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+def reload_config() -> _AudioCfg:
+    """重新读取 BGM_VOLUME / MUSIC_VOLUME / MUSIC_PROXY 等环境变量。"""
+    global _cfg  # noqa: PLW0603
+    _cfg = _AudioCfg(
+        bgm_vol=int(_env_float("BGM_VOLUME", 0.30) * 100),
+        music_vol=_env_float("MUSIC_VOLUME", 0.5),
+        proxy=os.getenv("MUSIC_PROXY") or os.getenv("HTTPS_PROXY") or os.getenv("HTTP_PROXY") or None,
+        bgm_cache_dir=Path(os.getenv("BGM_CACHE", "~/.cache/vtuber_bgm")).expanduser(),
+    )
+    return _cfg
+
+_cfg = reload_config()
+
+# 搜索 / 匿名取链 / 音频下载共用的连接池，避免每次请求重新握手 TCP+TLS
+_http: httpx.AsyncClient | None = None
+_http_proxy: Optional[str] = None  # 构建 _http 时使用的代理，变化时重建
+
+async def _get_http() -> httpx.AsyncClient:
+    """返回共享 AsyncClient（懒加载）；MUSIC_PROXY 等代理配置变化时才重建。"""
+    global _http, _http_proxy  # noqa: PLW0603
+    proxy = _cfg.proxy
+    if _http is None or _http.is_closed or proxy != _http_proxy:
+        old = _http
+        _http = httpx.AsyncClient(
+            timeout=10,
+            http2=HTTP2_AVAILABLE,
+            proxy=proxy,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=40, keepalive_expiry=60),
+        )
+        _http_proxy = proxy
+        if old is not None and not old.is_closed:
+            await old.aclose()
+    return _http
+
+async def close_http_client():
+    """关闭共享连接池，由主程序退出前调用。"""
+    global _http  # noqa: PLW0603
+    if _http is not None:
+        await _http.aclose()
+        _http = None
+
 # ---- 背景音乐状态 ----
 _bgm_enabled: bool = False
 _bgm_proc: Optional[subprocess.Popen] = None  # 当前 BGM 播放进程句柄
-_bgm_task: Optional[asyncio.Task] = None      # 背景循环任务句柄
-_current_track_end: float = 0.0  # monotonic time when当前曲目结束
+_point_proc: Optional[subprocess.Popen] = None  # 当前点歌播放进程句柄
+_STREAM_CHUNK = 64 * 1024  # 音频流式下载的块大小，内存峰值即一块
 
 # ---------------------------------------------------------------------------
 # ♫ 队列化播放：点歌优先，BGM 兜底
 # ---------------------------------------------------------------------------
 
 # 优先级 0：观众/AI 点播歌曲
-_point_q: asyncio.Queue[str] = asyncio.Queue()
-
-# 优先级 1：后台 BGM 随机循环
-_bgm_q: asyncio.Queue[str] = asyncio.Queue(maxsize=50)
+# 限制长度，防止刷屏点歌无限堆积、把正常点歌拖后数小时
+_POINT_Q_MAX = 10
+_point_q: asyncio.Queue[str] = asyncio.Queue(maxsize=_POINT_Q_MAX)
+
+# 优先级 1：后台 BGM 随机循环；由预取协程提前解析好下一首的播放链接。
+# 网易云链接约 20 分钟过期，只预取少量曲目，避免排到时已失效
+# 元素为 (song_id, url)；本地已缓存的曲目 url 为 None
+_bgm_q: asyncio.Queue[tuple[int, Optional[str]]] = asyncio.Queue(maxsize=2)
+_BGM_PREFETCH_BATCH = 3  # 每批并发解析的歌曲数
+# 整批都解析失败（断网 / 接口异常）时的退避等待，避免空转刷请求
+_BGM_PREFETCH_BACKOFF_MIN = 2.0
+_BGM_PREFETCH_BACKOFF_MAX = 60.0
+
+# 当前歌单的曲目 ID（只在首次使用 / 切换歌单时拉取）与本轮洗牌后的待播顺序；
+# 一轮播完才重新洗牌，保证一轮内不重复
+_track_ids: list[int] = []
+_track_order: deque[int] = deque()
 
 _music_worker_task: Optional[asyncio.Task] = None  # 全局播放协程
+_bgm_prefetch_task: Optional[asyncio.Task] = None  # BGM 链接预取协程
 
-# Utility to build ffplay command list (no shell needed)
+# 后台任务强引用：事件循环只保留弱引用，未保存的 Task 可能在运行中被 GC 回收
+_bg_tasks: set[asyncio.Task] = set()
+
+def _fire(coro) -> asyncio.Task:
+    """创建后台任务并保留引用，任务结束后自动移除。"""
+    task = asyncio.create_task(coro)
+    _bg_tasks.add(task)
+    task.add_done_callback(_bg_tasks.discard)
+    return task
+
+# BGM 开关 / 暂停状态变化时置位，唤醒空闲等待中的 _music_worker（替代每秒轮询）
+_bgm_state_changed = asyncio.Event()
+
+# Utility to build ffplay command list (no shell needed); "pipe:0" 表示从 stdin 读取
 def _build_ffplay_cmd(path_or_url: str, volume: int) -> list[str]:
     return [
         "ffplay",
@@ -86,89 +179,197 @@ def _build_ffplay_cmd(path_or_url: str, volume: int) -> list[str]:
         path_or_url,
     ]
 
+# ffplay 放进独立进程组，终止时连同其子进程 / 音频句柄一起结束
+if os.name == "nt":
+    _FFPLAY_SPAWN_KW: dict = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+else:
+    _FFPLAY_SPAWN_KW = {"start_new_session": True}  # setsid，进程组 ID == pid
+
+def _signal_ffplay(proc, force: bool = False) -> None:
+    """向 ffplay 所在进程组发送终止信号；force=True 时强制结束。"""
+    try:
+        if os.name == "nt":
+            if force:
+                proc.kill()
+            else:
+                proc.send_signal(signal.CTRL_BREAK_EVENT)
+        else:
+            os.killpg(proc.pid, signal.SIGKILL if force else signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+
+async def _reap_ffplay(proc) -> None:
+    try:
+        await asyncio.wait_for(proc.wait(), 1.0)
+    except asyncio.TimeoutError:
+        _signal_ffplay(proc, force=True)
+
+def _stop_ffplay(proc) -> None:
+    """终止 ffplay 进程组，1 秒内未退出则强制结束。"""
+    _signal_ffplay(proc)
+    _fire(_reap_ffplay(proc))
+
 async def _spawn_ffplay(url: str, volume: float = 0.25):
     """启动 ffplay 播放远程 URL，不使用 shell，以便后续准确终止进程"""
+    global _point_proc  # noqa: PLW0603
     vol = int(volume * 100)
-    proc = await asyncio.create_subprocess_exec(*_build_ffplay_cmd(url, vol))
-    rc = await proc.wait()
+    proc = await asyncio.create_subprocess_exec(*_build_ffplay_cmd(url, vol), **_FFPLAY_SPAWN_KW)
+    _point_proc = proc
+    try:
+        rc = await proc.wait()
+    finally:
+        _point_proc = None
     if rc != 0:
         logger.warning("ffplay 退出码 %s，可能无法直接流式播放: %s", rc, url)
 
+async def _play_point_song(url: str):
+    # 1) 暂停正在播放的 BGM（若有）
+    pause_background_music()
+
+    # 2) 播放点歌音频
+    await _spawn_ffplay(url, volume=_cfg.music_vol)
+
+    # 3) 若队列已空，则恢复 BGM
+    if _point_q.empty():
+        resume_background_music()
+
 async def _music_worker():
     """永驻协程：点歌队列优先，其次 BGM。确保不会并发播放。"""
-    global _bgm_enabled
+    held_bgm: Optional[tuple[int, Optional[str]]] = None  # 与点歌同时取到的 BGM，留到下一轮播放
     while True:
         try:
             # 点歌优先：播放前暂停 BGM，播放完毕后（且队列已空）再恢复
             if not _point_q.empty():
-                url = await _point_q.get()
-
-                # 1) 暂停正在播放的 BGM（若有）
-                pause_background_music()
-
-                # 2) 播放点歌音频
-                await _spawn_ffplay(url, volume=float(os.getenv("MUSIC_VOLUME", "0.25")))
-
-                # 3) 若队列已空，则恢复 BGM
-                if _point_q.empty():
-                    resume_background_music()
-
-                # 点歌处理完毕后立即进入下一轮循环
+                await _play_point_song(_point_q.get_nowait())
                 continue
 
-            # 若 BGM 关闭则休眠
+            # 若 BGM 关闭则挂起，直到状态变化再重新检查
             if not _bgm_enabled:
-                await asyncio.sleep(1)
+                _bgm_state_changed.clear()
+                await _bgm_state_changed.wait()
                 continue
 
-            # 取/补充 BGM 队列
-            if _bgm_q.empty():
-                # 重新洗牌歌单
-                ids = await _fetch_playlist_track_ids(_DEFAULT_BGM_PLAYLIST_ID)
-                random.shuffle(ids)
-                for _id in ids:
-                    url = await _netease_get_song_url(_id)
-                    if url:
-                        await _bgm_q.put(url)
-                        # 立即跳出，优先开始播放首曲
-                        break
+            if held_bgm is None:
+                # 同时等待两个队列：BGM 链接尚未就绪时，新点歌也能立即开播
+                point_get = asyncio.ensure_future(_point_q.get())
+                bgm_get = asyncio.ensure_future(_bgm_q.get())
+                try:
+                    await asyncio.wait((point_get, bgm_get), return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    # 未完成的 get 被取消时不会取走元素
+                    point_get.cancel()
+                    bgm_get.cancel()
+                if bgm_get.done() and not bgm_get.cancelled():
+                    held_bgm = bgm_get.result()
+                if point_get.done() and not point_get.cancelled():
+                    await _play_point_song(point_get.result())
+                    continue
 
-            url = await _bgm_q.get()
+            # 链接由 _bgm_prefetcher 在上一首播放期间解析好
+            song_id, url = held_bgm
+            held_bgm = None
             # 播放 BGM：阻塞等待曲目结束，点歌时通过 pause_background_music() 终止
-            await _play_bgm(url)
-
-            # 循环队列：将已播放歌曲重新放回队尾
-            try:
-                await _bgm_q.put(url)
-            except asyncio.QueueFull:
-                # 若队列满则丢弃最旧的一首，确保循环继续
-                _ = await _bgm_q.get()
-                await _bgm_q.put(url)
+            await _play_bgm(song_id, url)
         except Exception as e:
             logger.error("music_worker error: %s", e)
             await asyncio.sleep(5)
 
+async def _bgm_prefetcher():
+    """永驻协程：按洗牌后的歌单分批并发解析播放链接并放入 _bgm_q，队列满时自然阻塞。"""
+    backoff = _BGM_PREFETCH_BACKOFF_MIN
+    while True:
+        try:
+            if not _track_ids:
+                _track_ids[:] = await _fetch_playlist_track_ids(_DEFAULT_BGM_PLAYLIST_ID)
+                if not _track_ids:
+                    await asyncio.sleep(30)
+                    continue
+            if not _track_order:
+                order = list(_track_ids)
+                random.shuffle(order)
+                _track_order.extend(order)
+            batch = [_track_order.popleft() for _ in range(min(_BGM_PREFETCH_BATCH, len(_track_order)))]
+            # 本地已缓存的曲目无需再请求播放链接
+            todo = [_id for _id in batch if not _bgm_cache_file(_id).is_file()]
+            urls = dict(zip(todo, await asyncio.gather(*(_netease_get_song_url(_id) for _id in todo))))
+            queued = 0
+            for _id in batch:
+                if _id not in urls:
+                    await _bgm_q.put((_id, None))
+                    queued += 1
+                elif urls[_id]:
+                    await _bgm_q.put((_id, urls[_id]))
+                    queued += 1
+            if queued:
+                backoff = _BGM_PREFETCH_BACKOFF_MIN
+            else:
+                logger.warning("⚠️ 本批 BGM 链接全部解析失败，%.0fs 后重试", backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, _BGM_PREFETCH_BACKOFF_MAX)
+        except Exception as e:
+            logger.error("bgm_prefetcher error: %s", e)
+            await asyncio.sleep(5)
+
+# 播放链接缓存：song_id -> (过期时间 monotonic, url)；网易云链接约 20 分钟有效，按 15 分钟过期
+_URL_CACHE_TTL = 900.0
+_URL_CACHE_MAX = 1024
+_url_cache: OrderedDict[int, tuple[float, str]] = OrderedDict()
+
+# 搜索结果缓存：关键词 -> song_id（ID 不会变，只做 LRU 淘汰）
+_SEARCH_CACHE_MAX = 1024
+_search_cache: OrderedDict[str, int] = OrderedDict()
+
+def _cached_song_url(song_id: int) -> Optional[str]:
+    hit = _url_cache.get(song_id)
+    if hit is None:
+        return None
+    expires, url = hit
+    if time.monotonic() >= expires:
+        del _url_cache[song_id]
+        return None
+    _url_cache.move_to_end(song_id)
+    return url
+
+def _cache_song_url(song_id: int, url: str) -> str:
+    _url_cache[song_id] = (time.monotonic() + _URL_CACHE_TTL, url)
+    _url_cache.move_to_end(song_id)
+    if len(_url_cache) > _URL_CACHE_MAX:
+        _url_cache.popitem(last=False)
+    return url
+
 async def _netease_search_song(keyword: str) -> Optional[int]:
     """搜索歌曲并返回第一条 ID。"""
+    song_id = _search_cache.get(keyword)
+    if song_id is not None:
+        _search_cache.move_to_end(keyword)
+        return song_id
     try:
-        async with httpx.AsyncClient(timeout=10) as client:
-            r = await client.get(f"{_API_BASE}/search", params={"keywords": keyword})
+        client = await _get_http()
+        r = await client.get(f"{_API_BASE}/search", params={"keywords": keyword})
+        data = r.json()
+        # 登录受限判断
+        if data.get("code") in {301, 401}:
+            logger.info("🔒 接口需要登录，自动调用扫码登录…")
+            login_cli = await get_netease_client()
+            r = await login_cli.get("/search", params={"keywords": keyword})
             data = r.json()
-            # 登录受限判断
-            if data.get("code") in {301, 401}:
-                logger.info("🔒 接口需要登录，自动调用扫码登录…")
-                login_cli = await get_netease_client()
-                r = await login_cli.get("/search", params={"keywords": keyword})
-                data = r.json()
-            songs = data.get("result", {}).get("songs", [])
-            if songs:
-                return songs[0].get("id")
+        songs = data.get("result", {}).get("songs", [])
+        if songs:
+            song_id = songs[0].get("id")
+            if song_id:
+                _search_cache[keyword] = song_id
+                if len(_search_cache) > _SEARCH_CACHE_MAX:
+                    _search_cache.popitem(last=False)
+            return song_id
     except Exception as exc:  # noqa: BLE001
         logger.error("网易云搜索失败: %s", exc)
     return None
 
 async def _netease_get_song_url(song_id: int) -> Optional[str]:
     """获取歌曲播放 URL（优先带 Cookie 请求 /song/url/v1 获取完整音质）。"""
+    url = _cached_song_url(song_id)
+    if url:
+        return url
     try:
         login_cli = await get_netease_client()  # 确保已登录
         # 尝试无损 / 极高音质，按需回退
@@ -187,159 +388,231 @@ async def _netease_get_song_url(song_id: int) -> Optional[str]:
                 urls = data.get("data", [])
                 for _item in urls:
                     if _item.get("url") and not _item.get("freeTrialInfo"):
-                        return _item["url"]
+                        return _cache_song_url(song_id, _item["url"])
                 # 若全为试听，暂不返回，继续降级
             except Exception:
                 continue
         # 若仍失败，改用匿名接口（可能返回试听片段）
-        async with httpx.AsyncClient(timeout=10) as anon:
-            r = await anon.get(f"{_API_BASE}/song/url", params={"id": song_id})
-            data = r.json()
-            urls = data.get("data", [])
-            # 过滤试听 URL
-            for _item in urls:
-                if _item.get("url") and not _item.get("freeTrialInfo"):
-                    return _item["url"]
-            # 仍未找到完整曲 → 返回首个试听 URL 兜底播放
-            if urls and urls[0].get("url"):
-                return urls[0]["url"]
+        anon = await _get_http()
+        r = await anon.get(f"{_API_BASE}/song/url", params={"id": song_id})
+        data = r.json()
+        urls = data.get("data", [])
+        # 过滤试听 URL
+        for _item in urls:
+            if _item.get("url") and not _item.get("freeTrialInfo"):
+                return _cache_song_url(song_id, _item["url"])
+        # 仍未找到完整曲 → 返回首个试听 URL 兜底播放（不缓存，下次仍尝试完整版）
+        if urls and urls[0].get("url"):
+            return urls[0]["url"]
     except Exception as exc:  # noqa: BLE001
         logger.error("获取歌曲 URL 失败: %s", exc)
     return None
 
+_PLAYLIST_PAGE_SIZE = 200
+_PLAYLIST_FETCH_CONCURRENCY = 5
+
 async def _fetch_playlist_track_ids(playlist_id: int) -> list[int]:
-    """返回歌单所有歌曲 ID。"""
+    """返回歌单所有歌曲 ID。先取歌曲总数，其余分页并发请求。"""
     ids: list[int] = []
     try:
         login_cli = await get_netease_client(force_login=False)
-        offset = 0
-        while True:
-            r = await login_cli.get(
-                "/playlist/track/all",
-                params={"id": playlist_id, "limit": 200, "offset": offset},
-            )
-            data = r.json()
-            songs = data.get("songs", [])
-            ids.extend([s.get("id") for s in songs if s.get("id")])
-            if len(songs) < 200:
-                break
-            offset += 200
+        sem = asyncio.Semaphore(_PLAYLIST_FETCH_CONCURRENCY)
+
+        async def fetch(offset: int) -> list[dict]:
+            async with sem:
+                r = await login_cli.get(
+                    "/playlist/track/all",
+                    params={"id": playlist_id, "limit": _PLAYLIST_PAGE_SIZE, "offset": offset},
+                )
+                return r.json().get("songs", [])
+
+        # 歌单详情（总数）与首页同时请求
+        detail, first = await asyncio.gather(
+            login_cli.get("/playlist/detail", params={"id": playlist_id}),
+            fetch(0),
+        )
+        pages = [first]
+        if len(first) >= _PLAYLIST_PAGE_SIZE:
+            try:
+                total = int(detail.json().get("playlist", {}).get("trackCount") or 0)
+            except ValueError:
+                total = 0
+            if total > _PLAYLIST_PAGE_SIZE:
+                pages += await asyncio.gather(
+                    *(fetch(off) for off in range(_PLAYLIST_PAGE_SIZE, total, _PLAYLIST_PAGE_SIZE))
+                )
+            else:
+                # 取不到总数时退回逐页翻取
+                offset = _PLAYLIST_PAGE_SIZE
+                while True:
+                    songs = await fetch(offset)
+                    pages.append(songs)
+                    if len(songs) < _PLAYLIST_PAGE_SIZE:
+                        break
+                    offset += _PLAYLIST_PAGE_SIZE
+        ids = [s.get("id") for songs in pages for s in songs if s.get("id")]
     except Exception as exc:
         logger.error("获取歌单失败: %s", exc)
-    random.shuffle(ids)
     return ids
 
-async def _bgm_loop(track_ids: list[int]):
-    global _bgm_enabled
-    idx = 0
-    while _bgm_enabled:
-        try:
-            # 若当前曲目尚未播放完，等待
-            if time.monotonic() < _current_track_end:
-                await asyncio.sleep(1)
-                continue
+# ---- BGM 本地缓存：<BGM_CACHE>/<song_id>.mp3，循环播放时复用，超出预算按最近使用淘汰 ----
+_BGM_CACHE_MAX_BYTES = 2_000_000_000
 
-            alive = _bgm_proc and (_bgm_proc.returncode is None)
-            if not alive:
-                if idx >= len(track_ids):
-                    random.shuffle(track_ids)
-                    idx = 0
-                song_id = track_ids[idx]
-                idx += 1
-                url = await _netease_get_song_url(song_id)
-                if not url:
-                    continue
-                await _play_bgm(url)
-            await asyncio.sleep(1)
-        except Exception as exc:
-            logger.error("BGM 循环异常: %s", exc)
-            await asyncio.sleep(5)
+def _bgm_cache_file(song_id: int) -> Path:
+    return _cfg.bgm_cache_dir / f"{song_id}.mp3"
 
-async def _play_bgm(url: str):
+def _trim_bgm_cache(max_bytes: int = _BGM_CACHE_MAX_BYTES) -> None:
+    """缓存超出预算时按 mtime（命中时会刷新）从旧到新删除；涉及磁盘 IO，在线程中调用。"""
+    entries = []
     try:
-        proxy_url = os.getenv("MUSIC_PROXY") or os.getenv("HTTPS_PROXY") or os.getenv("HTTP_PROXY")
-        async with httpx.AsyncClient(timeout=20, proxies=proxy_url or None) as client:
-            r = await client.get(url)
-            r.raise_for_status()
-            audio_bytes = r.content
-
-        if not pygame.mixer.get_init():
-            pygame.mixer.init()
-        pygame.mixer.set_num_channels(4)
+        with os.scandir(_cfg.bgm_cache_dir) as it:
+            for e in it:
+                if e.name.endswith(".mp3"):
+                    st = e.stat()
+                    entries.append((st.st_mtime, st.st_size, e.path))
+    except OSError:
+        return
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
 
-        tmp = pathlib.Path(tempfile.gettempdir()) / f"bgm_{uuid.uuid4().hex}.mp3"
-        tmp.write_bytes(audio_bytes)
+async def _stream_to_ffplay(proc, url: str, song_id: int):
+    """边下载边写入 ffplay stdin；完整曲目同时落盘到缓存，下载完整后才改名生效。"""
+    dest = _bgm_cache_file(song_id)
+    part = dest.with_name(dest.name + ".part")
+    # 试听片段不进 _url_cache，只缓存完整曲目
+    f = None
+    if _cached_song_url(song_id) == url:
+        try:
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            f = part.open("wb")
+        except OSError as exc:
+            logger.debug("BGM 缓存不可用: %s", exc)
+    complete = False
+    client = await _get_http()
+    try:
+        async with client.stream("GET", url, timeout=20) as r:
+            r.raise_for_status()
+            async for chunk in r.aiter_bytes(_STREAM_CHUNK):
+                if f:
+                    f.write(chunk)
+                proc.stdin.write(chunk)
+                await proc.stdin.drain()
+        complete = True
+    except (BrokenPipeError, ConnectionResetError):
+        # ffplay 已先退出（暂停/停止时被终止），丢弃剩余数据
+        pass
+    finally:
+        proc.stdin.close()
+        if f:
+            f.close()
+            if complete:
+                part.replace(dest)
+                _fire(asyncio.to_thread(_trim_bgm_cache))
+            else:
+                part.unlink(missing_ok=True)
 
-        vol = int(float(os.getenv("BGM_VOLUME", "0.30")) * 100)  # ffplay 音量 0~100
-        global _bgm_proc, _current_track_end  # noqa: PLW0603
-        _bgm_proc = await asyncio.create_subprocess_exec(*_build_ffplay_cmd(str(tmp), vol))
-        logger.info("🎧 [ffplay] 播放背景音乐: %s", url)
+async def _play_bgm(song_id: int, url: Optional[str] = None):
+    try:
+        vol = _cfg.bgm_vol  # ffplay 音量 0~100
+        global _bgm_proc  # noqa: PLW0603
+        cached = _bgm_cache_file(song_id)
+        if cached.is_file() and cached.stat().st_size > 0:
+            os.utime(cached)  # 刷新 mtime，供 _trim_bgm_cache 按最近使用淘汰
+            src = str(cached)
+            proc = await asyncio.create_subprocess_exec(*_build_ffplay_cmd(src, vol), **_FFPLAY_SPAWN_KW)
+        else:
+            url = url or await _netease_get_song_url(song_id)
+            if not url:
+                logger.warning("⚠️ 未获取到 BGM 播放 URL (id=%s)", song_id)
+                return
+            src = url
+            # ffplay 从 stdin 读取：边下载边播放，首个缓冲到达即可出声
+            proc = await asyncio.create_subprocess_exec(
+                *_build_ffplay_cmd("pipe:0", vol), stdin=asyncio.subprocess.PIPE, **_FFPLAY_SPAWN_KW
+            )
+        _bgm_proc = proc
+        logger.info("🎧 [ffplay] 播放背景音乐: %s", src)
 
-        # 估算长度：简单等待 180s 作为兜底；可替换为实际长度
-        _current_track_end = time.monotonic() + 180
+        if proc.stdin is not None:
+            await _stream_to_ffplay(proc, url, song_id)
 
-        await _bgm_proc.wait()
+        await proc.wait()
         _bgm_proc = None
-        _current_track_end = 0.0
         logger.debug("🎧 BGM 曲目结束")
     except Exception as exc:
         logger.error("播放背景音乐失败: %s", exc)
 
+def _ensure_music_worker():
+    """确保播放协程在运行（点歌不依赖 BGM 是否开启）。"""
+    global _music_worker_task
+    if _music_worker_task is None or _music_worker_task.done():
+        _music_worker_task = asyncio.create_task(_music_worker())
+
 async def start_background_music():
     """启动后台纯音乐播放任务（若未启动）。"""
     global _bgm_enabled
     if _bgm_enabled:
         return
     _bgm_enabled = True
+    _bgm_state_changed.set()
 
-    # 若已在跑 worker，不重复启动
-    global _music_worker_task
-    if _music_worker_task is None or _music_worker_task.done():
-        _music_worker_task = asyncio.create_task(_music_worker())
+    # 若已在跑 worker / 预取协程，不重复启动
+    global _bgm_prefetch_task
+    _ensure_music_worker()
+    if _bgm_prefetch_task is None or _bgm_prefetch_task.done():
+        _bgm_prefetch_task = asyncio.create_task(_bgm_prefetcher())
 
 def pause_background_music():
     global _bgm_proc
     if _bgm_proc and _bgm_proc.returncode is None:
-        _bgm_proc.terminate()
+        _stop_ffplay(_bgm_proc)
         _bgm_proc = None
+    _bgm_state_changed.set()
 
 def resume_background_music():
     if _bgm_enabled and not (_bgm_proc and _bgm_proc.returncode is None):
         # 重新启动循环任务
-        asyncio.create_task(start_background_music())
+        _fire(start_background_music())
 
 def stop_background_music():
     global _bgm_enabled
     _bgm_enabled = False
-    global _bgm_proc, _bgm_task, _music_worker_task
-    if _bgm_proc and _bgm_proc.returncode is None:
-        try:
-         _bgm_proc.terminate()
-        except ProcessLookupError:
-            pass
-        except Exception:
-            try:
-                _bgm_proc.kill()
-            except Exception:
-                pass
+    _bgm_state_changed.set()
+    global _bgm_proc, _point_proc, _music_worker_task
+    # ffplay 运行在独立进程组，收不到终端的 Ctrl+C，退出时必须显式终止
+    for proc in (_bgm_proc, _point_proc):
+        if proc and proc.returncode is None:
+            _stop_ffplay(proc)
     _bgm_proc = None
-    if _bgm_task:
-        _bgm_task.cancel()
+    _point_proc = None
     if _music_worker_task:
         _music_worker_task.cancel()
+    if _bgm_prefetch_task:
+        _bgm_prefetch_task.cancel()
 
 def configure_bgm(playlist_id: Optional[int] = None, volume: Optional[float] = None):
     """由外部配置调用，动态调整 BGM 歌单和音量。"""
     global _DEFAULT_BGM_PLAYLIST_ID
-    if playlist_id:
+    if playlist_id and playlist_id != _DEFAULT_BGM_PLAYLIST_ID:
         _DEFAULT_BGM_PLAYLIST_ID = playlist_id
+        # 切换歌单：清空曲目列表，预取协程下一轮重新拉取并洗牌
+        _track_ids.clear()
+        _track_order.clear()
     if volume is not None:
-        # 更新环境变量便于后续 Channel 创建
+        # 更新环境变量并刷新缓存配置，下一首起生效
         os.environ["BGM_VOLUME"] = str(volume)
+        reload_config()
 
     # 若后台音乐未开启，则自动启动
     if not _bgm_enabled:
-        asyncio.create_task(start_background_music())
+        _fire(start_background_music())
 
 # ---------------------------------------------------------------------------
 # 🎛️ 总调度
@@ -356,20 +629,36 @@ _STAR_WRAP_PATTERN = re.compile(r"\*(?!\[)([^*]+?)\*")  # 匹配非指令的 *
 # 匹配 <"表达":on> / <"一次性动作">
 _EXT_EXPR_PATTERN = re.compile(r"<\s*\"[^\"]+\"\s*(?::\s*(?:on|off))?\s*>")
 
+# strip_control_sequences 用的合并扫描：*[Action]:Content* | *普通文本* | <"表情">，一次遍历完成
+# （*[voice]:...* 已被 Action 分支覆盖）
+_CONTROL_SEQ_PATTERN = re.compile(
+    r"\*\[(?P<action>[A-Za-z]+)\]:(?P<content>[^*]+?)\*"
+    r"|\*(?!\[)(?P<star>[^*]+?)\*"
+    r"|<\s*\"[^\"]+\"\s*(?::\s*(?:on|off))?\s*>"
+)
+
+# 情感标记 *[emotion]:喜悦* / *[情感]:喜悦*
+_EMOTION_PATTERN = re.compile(r"\*\[(?:emotion|情感)\]:(喜悦|愤怒|悲伤|惊讶|恐惧|平静)\*")
+
 async def dispatch_actions(ai_reply: str):
     """扫描 AI 回复，触发对应动作 (Music / Voice / 未来其它)。"""
     try:
-        # 首先处理外部 <"表情"> 指令 via VTS controller
-        await _ensure_vts_connected()
-        if _vts_ctrl:
+        # 首先处理外部 <"表情"> 指令 via VTS controller；VTS 不可用时不影响后续点歌等指令
+        try:
+            if _vts_ctrl is None:
+                await init_vts()
             await _vts_ctrl.handle_input(ai_reply)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("VTS 表情指令处理失败: %s", exc)
+
+        # 大多数回复不含 *[...]* 指令，先用子串判断跳过正则扫描
+        if "*[" not in ai_reply:
+            return
             
         # 检测情感标记，记录日志（TTS适配器会处理）
-        emotion_pattern = r'\*\[(emotion|情感)\]:(喜悦|愤怒|悲伤|惊讶|恐惧|平静)\*'
-        emotion_match = re.search(emotion_pattern, ai_reply)
+        emotion_match = _EMOTION_PATTERN.search(ai_reply)
         if emotion_match:
-            emotion_type = emotion_match.group(2)
-            logging.info(f"检测到情感标记: {emotion_type}")
+            logger.info("检测到情感标记: %s", emotion_match.group(1))
 
         for m in _ACTION_PATTERN.finditer(ai_reply):
             action = m.group("action").lower()
@@ -414,24 +703,28 @@ async def dispatch_actions(ai_reply: str):
     except Exception as exc:  # noqa: BLE001
         logger.error("动作调度失败: %s", exc)
 
-def _replace_action(match: re.Match[str]) -> str:
+def _replace_control(match: re.Match[str]) -> str:
     """strip_control_sequences 的替换回调"""
-    action = match.group("action").lower()
-    content = match.group("content").strip()
-    # Music 指令已被 dispatch 消耗，这里清除文本；其它动作保留内容
-    return "" if action in {"music", "bgm"} else content
+    action = match.group("action")
+    if action is not None:
+        # Music 指令已被 dispatch 消耗，这里清除文本；其它动作保留内容
+        if action.lower() in {"music", "bgm"}:
+            return ""
+        # 内容里若夹带 <"表情">，同样移除
+        return _EXT_EXPR_PATTERN.sub("", match.group("content").strip())
+    star = match.group("star")
+    if star is not None:
+        # *普通文本* -> 普通文本
+        return _EXT_EXPR_PATTERN.sub("", star)
+    # <"表情"> 控制指令，避免 TTS 读出
+    return ""
 
 def strip_control_sequences(ai_reply: str) -> str:
     """去掉控制指令后返回纯文本，供后续 TTS / 弹幕。"""
-    # 1) 处理所有 *[Action]:Content*
-    text = _ACTION_PATTERN.sub(_replace_action, ai_reply)
-    # 2) 再处理残余兼容 pattern（如旧版 _VOICE_PATTERN）
-    text = _VOICE_PATTERN.sub(lambda m: m.group("content").strip(), text)
-    # 3) 将 *普通文本* -> 普通文本
-    text = _STAR_WRAP_PATTERN.sub(r"\1", text)
-    # 4) 移除 <"表情"> 控制指令，避免 TTS 读出
-    text = _EXT_EXPR_PATTERN.sub("", text)
-    return text.strip()
+    # 所有控制指令都以 * 或 < 开头，纯对白直接返回
+    if "*" not in ai_reply and "<" not in ai_reply:
+        return ai_reply.strip()
+    return _CONTROL_SEQ_PATTERN.sub(_replace_control, ai_reply).strip()
 
 async def handle_music_command(song: str, artist: Optional[str] = None):
     """处理点歌指令。"""
@@ -447,22 +740,21 @@ async def handle_music_command(song: str, artist: Optional[str] = None):
     await _play_music(url)
 
 # ---------------------------------------------------------------------------
-# 修改 _play_music 以暂停/恢复 BGM
+# 点歌入队：由 _music_worker 暂停 BGM 后播放，队列清空后恢复 BGM
 # ---------------------------------------------------------------------------
 
-async def _play_music(url: str):
-    """立刻播放点歌，优先级高于当前 BGM。"""
-    # 1) 完全停止背景音乐，避免与点歌重叠
-    was_bgm_enabled = _bgm_enabled
-    await asyncio.get_event_loop().run_in_executor(None, stop_background_music)
-
-    # 2) 播放点歌内容（独占）
-    await _spawn_ffplay(url, volume=float(os.getenv("MUSIC_VOLUME", "0.5")))
-
-    # 3) 点歌播放结束后，如之前开启，则恢复 BGM
-    if was_bgm_enabled:
-        await start_background_music()
-    logger.info("🎵 点歌已播放完成，并恢复 BGM")
+async def _play_music(url: str) -> bool:
+    """把点歌加入队列，优先级高于当前 BGM；队列已满时丢弃并返回 False。"""
+    try:
+        _point_q.put_nowait(url)
+    except asyncio.QueueFull:
+        logger.warning("⚠️ 点歌队列已满 (%d 首)，忽略本次点歌: %s", _POINT_Q_MAX, url)
+        return False
+    _ensure_music_worker()
+    # 立即打断正在播放的 BGM，并唤醒空闲中的 worker
+    pause_background_music()
+    logger.info("🎵 已加入点歌队列: %s (len=%d)", url, _point_q.qsize())
+    return True
 
 def parse_playlist_id(raw: str | int | None) -> Optional[int]:
     """从数字或网易云歌单 URL 中提取歌单 ID。
@@ -506,17 +798,16 @@ async def schedule_idle_animation():
         _idle_anim_task.cancel()
 
     async def _timer():
-        import logging as _lg
-        _lgger = _lg.getLogger(__name__)
         try:
             await asyncio.sleep(IDLE_DELAY)
-            await _ensure_vts_connected()
+            if _vts_ctrl is None:
+                await init_vts()
             await _vts_ctrl.trigger_hotkey(IDLE_HOTKEY)
-            _lgger.info("💤 Idle animation triggered")
+            logger.info("💤 Idle animation triggered")
         except asyncio.CancelledError:
             pass
         except Exception as exc:
-            _lgger.error("Idle animation error: %s", exc)
+            logger.error("Idle animation error: %s", exc)
 
     _idle_anim_task = asyncio.create_task(_timer())
 
@@ -529,11 +820,10 @@ async def cancel_idle_animation(trigger_break: bool = True):
         _idle_anim_task = None
 
     if trigger_break:
-        import logging as _lg
-        _lgger = _lg.getLogger(__name__)
         try:
-            await _ensure_vts_connected()
+            if _vts_ctrl is None:
+                await init_vts()
             await _vts_ctrl.trigger_hotkey(INTERRUPT_IDLE_HOTKEY)
-            _lgger.info("⏹️ Idle animation interrupted")
+            logger.info("⏹️ Idle animation interrupted")
         except Exception as exc:
-            _lgger.error("Interrupt idle error: %s", exc) 
\ No newline at end of file
+            logger.error("Interrupt idle error: %s", exc) 
\ No newline at end of file
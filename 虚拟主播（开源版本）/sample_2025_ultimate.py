@@ -58,7 +58,7 @@ from music_login import get_netease_client
 # 本地 LLM 适配器
 from llm_adapter import LLMRouter
 # AI 控制指令处理
-from ai_action import dispatch_actions, strip_control_sequences, start_background_music, configure_bgm, parse_playlist_id
+from ai_action import dispatch_actions, strip_control_sequences, start_background_music, stop_background_music, configure_bgm, parse_playlist_id, close_http_client, init_vts
 
 # 数据库配置
 try:
@@ -1190,6 +1190,12 @@ async def main():
             print(f"⚠️ 警告: 网易云登录初始化失败: {e}")
             print("   背景音乐和点歌功能可能不可用")
 
+        # 提前连接 VTube Studio，避免首条回复时才握手；失败时回复调度会再次尝试
+        try:
+            await init_vts()
+        except Exception as e:
+            logger.warning(f"VTS 连接失败: {e}")
+
         # 启动背景纯音乐播放（低音量循环）
         try:
             await start_background_music()
@@ -1207,6 +1213,11 @@ async def main():
         traceback.print_exc()
         print(f"\n❌ 程序启动失败: {e}")
         print("请检查日志文件 ai_vtuber_2025.log 获取详细错误信息")
+    finally:
+        # 终止 BGM / 点歌的 ffplay 进程组（它们收不到 Ctrl+C）
+        stop_background_music()
+        # 释放网易云共享连接池
+        await close_http_client()
 
 if __name__ == "__main__":
     print("🎌 B站AI虚拟主播弹幕回复系统 - 2025年终极版本")
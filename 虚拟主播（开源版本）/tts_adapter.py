@@ -28,8 +28,18 @@ class BaseTTSProvider(abc.ABC):
         self.config = config
 
     @abc.abstractmethod
-    async def synthesize(self, text: str) -> str:
-        """合成并返回本地音频文件路径 (mp3/wav 等)"""
+    async def synthesize(self, text: str, out_stem: Optional[str] = None) -> str:
+        """合成并返回本地音频文件路径 (mp3/wav 等)
+
+        out_stem 为不含扩展名的输出路径，传入时覆盖写入该位置（扩展名由 Provider 决定），
+        供调用方复用固定的临时文件；不传则每次生成新的临时文件。
+        """
+
+    @staticmethod
+    def _out_file(out_stem: Optional[str], ext: str) -> pathlib.Path:
+        if out_stem:
+            return pathlib.Path(f"{out_stem}.{ext}")
+        return pathlib.Path(tempfile.gettempdir()) / f"tts_{uuid.uuid4().hex}.{ext}"
 
     async def cleanup(self, path: str):
         try:
@@ -86,7 +96,7 @@ class BaseTTSProvider(abc.ABC):
 class EdgeTTSProvider(BaseTTSProvider):
     name = "edge"
 
-    async def synthesize(self, text: str) -> str:
+    async def synthesize(self, text: str, out_stem: Optional[str] = None) -> str:
         import edge_tts
         voice = self.config.get("voice", "zh-CN-XiaoyiNeural")
         # 简单清理，移除特殊动作括号 (如 "(动作)文本" )
@@ -104,7 +114,7 @@ class EdgeTTSProvider(BaseTTSProvider):
         tts_text = clean(clean_text)
         if not tts_text:
             raise ValueError("Empty text after clean")
-        tmp = pathlib.Path(tempfile.gettempdir()) / f"tts_{uuid.uuid4().hex}.mp3"
+        tmp = self._out_file(out_stem, "mp3")
         communicate = edge_tts.Communicate(tts_text, voice)
         await communicate.save(str(tmp))
         return str(tmp)
@@ -112,7 +122,7 @@ class EdgeTTSProvider(BaseTTSProvider):
 class VITSHTTPProvider(BaseTTSProvider):
     name = "vits"
 
-    async def synthesize(self, text: str) -> str:
+    async def synthesize(self, text: str, out_stem: Optional[str] = None) -> str:
         import httpx, urllib.parse, os
         url = self.config.get("url")
         if not url:
@@ -143,14 +153,14 @@ class VITSHTTPProvider(BaseTTSProvider):
             r = await client.get(full_url)
             r.raise_for_status()
             ext = params["format"]
-            tmp = pathlib.Path(tempfile.gettempdir()) / f"tts_{uuid.uuid4().hex}.{ext}"
+            tmp = self._out_file(out_stem, ext)
             tmp.write_bytes(r.content)
             return str(tmp)
 
 class GPTSoVITSProvider(BaseTTSProvider):
     name = "gpt-sovits"
     
-    async def synthesize(self, text: str) -> str:
+    async def synthesize(self, text: str, out_stem: Optional[str] = None) -> str:
         import httpx, urllib.parse, os
         url = self.config.get("gptsovits_url")
         if not url:
@@ -189,7 +199,7 @@ class GPTSoVITSProvider(BaseTTSProvider):
             r = await client.post(url, data=params, files=files)
             r.raise_for_status()
             ext = params.get("format", "mp3")
-            tmp = pathlib.Path(tempfile.gettempdir()) / f"tts_{uuid.uuid4().hex}.{ext}"
+            tmp = self._out_file(out_stem, ext)
             tmp.write_bytes(r.content)
             return str(tmp)
 